@@ -1,18 +1,56 @@
+import json
+import os
+import threading
+
 import streamlit as st
 from streamlit_lottie import st_lottie
-import requests
 
 st.set_page_config(page_title="Diagnóstico Empresarial", layout="wide")
 
-# ===== Função para carregar animação =====
-def load_lottie_url(url):
-    r = requests.get(url)
-    if r.status_code != 200:
+# ===== Animação Lottie =====
+# A página não depende da rede: mostra a animação embutida em assets/ (ou a cópia do LottieFiles baixada antes).
+# Buscar a animação original no LottieFiles só acontece com HOME_LOTTIE_BUSCAR=1, em segundo plano e com timeout.
+HERO_URL = "https://assets1.lottiefiles.com/packages/lf20_tutvdkg0.json"
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+HERO_EMBUTIDO = os.path.join(DIRETORIO_APP, "assets", "hero_lottie.json")
+HERO_CACHE = os.getenv("HOME_LOTTIE_CACHE_PATH", os.path.join(DIRETORIO_APP, ".cache", "hero_lottie.json"))
+HERO_BUSCAR = os.getenv("HOME_LOTTIE_BUSCAR", "0") == "1"
+HERO_TIMEOUT = float(os.getenv("HOME_LOTTIE_TIMEOUT", "5"))
+
+def _ler_json(caminho):
+    try:
+        with open(caminho, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
         return None
-    return r.json()
 
-# ===== Animação Lottie (exemplo do LottieFiles) =====
-lottie_hero = load_lottie_url("https://assets1.lottiefiles.com/packages/lf20_tutvdkg0.json")
+def _baixar_hero(hero):
+    try:
+        import requests
+        r = requests.get(HERO_URL, timeout=HERO_TIMEOUT)
+        r.raise_for_status()
+        animacao = r.json()
+    except Exception:
+        return
+    hero["animacao"] = animacao
+    try:
+        os.makedirs(os.path.dirname(HERO_CACHE), exist_ok=True)
+        temporario = f"{HERO_CACHE}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(animacao, f)
+        os.replace(temporario, HERO_CACHE)
+    except OSError:
+        pass
+
+@st.cache_resource
+def carregar_hero():
+    """Animação do hero, lida uma vez por processo; a versão baixada em segundo plano entra quando chegar."""
+    hero = {"animacao": _ler_json(HERO_CACHE) or _ler_json(HERO_EMBUTIDO)}
+    if HERO_BUSCAR and not os.path.exists(HERO_CACHE):
+        threading.Thread(target=_baixar_hero, args=(hero,), daemon=True, name="hero-lottie").start()
+    return hero
+
+lottie_hero = carregar_hero()["animacao"]
 
 # ===== HERO SECTION =====
 st.markdown("""
@@ -0,0 +1,160 @@
+# Cache em disco de resultados de consultas, por impressão digital dos filtros
+
+# cache_resultados.py
+#
+# Cada resultado é um arquivo Parquet em CACHE_DIR; um índice SQLite guarda a chave, a versão da base em
+# que o resultado foi lido, o tamanho e o último acesso. O conjunto fica limitado a ORCAMENTO_BYTES
+# (despejo LRU) e um resultado vale enquanto a base não é recarregada (enriquecimento.versao_base()).
+# O cache é compartilhado por todas as sessões do processo e nenhuma delas precisa limpá-lo.
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import uuid
+
+import pandas as pd
+
+from colunas import assinatura
+from enriquecimento import versao_base
+from filtros import impressao_digital
+
+CACHE_DIR = os.getenv(
+    "RESULTADOS_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "resultados"),
+)
+ORCAMENTO_BYTES = int(float(os.getenv("RESULTADOS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+# Sem versão da base (view comum, ver enriquecimento.SQL_VERSAO_BASE) só o tempo invalida
+TTL_SEM_VERSAO_HORAS = float(os.getenv("RESULTADOS_CACHE_TTL_HORAS", "24"))
+
+
+def chave_resultado(espec, uso):
+    """Chave de um resultado compilado de `espec` com as colunas de `uso` (colunas.py)."""
+    return f"{impressao_digital(espec)}-{assinatura(uso)}"
+
+
+def chave_sql(sql, params=None):
+    """Chave de uma consulta montada à mão: SQL sem diferenças de espaçamento mais os parâmetros."""
+    canonico = " ".join(str(sql).split()).rstrip(";") + "\n" + json.dumps(params or {}, sort_keys=True, default=str)
+    return "sql-" + hashlib.sha256(canonico.encode("utf-8")).hexdigest()[:24]
+
+
+def _abrir_indice():
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(CACHE_DIR, "indice.sqlite3"), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resultados (
+            chave TEXT PRIMARY KEY,
+            versao_base TEXT NOT NULL,
+            arquivo TEXT NOT NULL,
+            bytes INTEGER NOT NULL,
+            gravado_em REAL NOT NULL,
+            usado_em REAL NOT NULL
+        )
+    """)
+    return conn
+
+
+def _remover(conn, chave, arquivo):
+    conn.execute("DELETE FROM resultados WHERE chave = ?", (chave,))
+    try:
+        os.remove(os.path.join(CACHE_DIR, arquivo))
+    except OSError:
+        pass
+
+
+def _valido(versao_registro, gravado_em, versao):
+    if versao_registro != versao:
+        return False
+    return bool(versao) or gravado_em >= time.time() - TTL_SEM_VERSAO_HORAS * 3600
+
+
+def ler_resultado(chave, versao=None):
+    """DataFrame guardado em `chave` para a carga atual da base, ou None."""
+    versao = versao_base() if versao is None else versao
+    conn = _abrir_indice()
+    try:
+        registro = conn.execute(
+            "SELECT arquivo, versao_base, gravado_em FROM resultados WHERE chave = ?", (chave,)
+        ).fetchone()
+        if registro is None:
+            return None
+        arquivo, versao_registro, gravado_em = registro
+        if not _valido(versao_registro, gravado_em, versao):
+            _remover(conn, chave, arquivo)
+            conn.commit()
+            return None
+        try:
+            df = pd.read_parquet(os.path.join(CACHE_DIR, arquivo))
+        except Exception:
+            # Arquivo apagado ou corrompido: descarta a entrada
+            _remover(conn, chave, arquivo)
+            conn.commit()
+            return None
+        conn.execute("UPDATE resultados SET usado_em = ? WHERE chave = ?", (time.time(), chave))
+        conn.commit()
+        return df
+    finally:
+        conn.close()
+
+
+def gravar_resultado(chave, df, versao=None):
+    """
+    Grava `df` em `chave` e despeja entradas de cargas anteriores e as menos usadas até caber no
+    orçamento. Resultados maiores que o orçamento, ou que o Parquet não consegue representar, não são
+    guardados. Retorna True se gravou.
+    """
+    versao = versao_base() if versao is None else versao
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    arquivo = f"{chave}.parquet"
+    caminho = os.path.join(CACHE_DIR, arquivo)
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.to_parquet(temporario, index=False)
+        tamanho = os.path.getsize(temporario)
+        if tamanho > ORCAMENTO_BYTES:
+            os.remove(temporario)
+            return False
+        os.replace(temporario, caminho)
+    except Exception:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        return False
+
+    agora = time.time()
+    conn = _abrir_indice()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO resultados (chave, versao_base, arquivo, bytes, gravado_em, usado_em) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (chave, versao, arquivo, tamanho, agora, agora),
+        )
+        _despejar(conn, versao)
+        conn.commit()
+    finally:
+        conn.close()
+    return True
+
+
+def _despejar(conn, versao):
+    for chave, arquivo, versao_registro, gravado_em in conn.execute(
+        "SELECT chave, arquivo, versao_base, gravado_em FROM resultados"
+    ).fetchall():
+        if not _valido(versao_registro, gravado_em, versao):
+            _remover(conn, chave, arquivo)
+
+    total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM resultados").fetchone()[0]
+    if total <= ORCAMENTO_BYTES:
+        return
+    for chave, arquivo, tamanho in conn.execute(
+        "SELECT chave, arquivo, bytes FROM resultados ORDER BY usado_em"
+    ).fetchall():
+        _remover(conn, chave, arquivo)
+        total -= tamanho
+        if total <= ORCAMENTO_BYTES:
+            break
+
@@ -0,0 +1,65 @@
+# CNPJs como chaves int64 para cruzamentos, exclusões e diferenças de conjuntos
+
+# chaves_cnpj.py
+#
+# Um CNPJ (14 dígitos) cabe num int64. Cruzar listas grandes (universo menos clientes, CNPJs a excluir)
+# com arrays numpy ordenados e searchsorted evita milhões de objetos str e o hashing de cada um.
+# O texto de 14 dígitos só é montado na hora de exibir, exportar ou mandar para o banco.
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+INVALIDA = -1  # chave de valores nulos ou que não são CNPJ
+_MAXIMO = 10 ** 14
+
+
+def para_chaves(valores):
+    """
+    Array int64 com uma chave por valor de `valores` (mesma ordem e tamanho). Aceita texto com ou sem
+    máscara, com ou sem zeros à esquerda, e números; nulos, vazios, zero e mais de 14 dígitos viram INVALIDA.
+    """
+    serie = valores if isinstance(valores, pd.Series) else pd.Series(valores, dtype=object)
+    if pd.api.types.is_integer_dtype(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype):
+        chaves = serie.to_numpy(dtype=np.int64)
+    elif pd.api.types.is_float_dtype(serie.dtype):
+        # Coluna numérica vinda de planilha: sem casas decimais, senão não é CNPJ
+        inteiros = serie.where(serie.notna() & (serie % 1 == 0) & (serie.abs() < _MAXIMO))
+        chaves = inteiros.fillna(INVALIDA).to_numpy(dtype=np.int64)
+    else:
+        # Strings Arrow: limpeza e conversão rodam no pyarrow, sem um objeto Python por linha
+        texto = serie.astype(str).where(serie.notna()).astype(pd.StringDtype("pyarrow"))
+        digitos = texto.str.replace(r"\.0$|\D", "", regex=True)
+        validos = digitos.str.len().between(1, 14).fillna(False).astype(bool)
+        chaves = digitos.where(validos).astype("int64[pyarrow]").to_numpy(dtype=np.int64, na_value=INVALIDA)
+    return np.where((chaves <= 0) | (chaves >= _MAXIMO), INVALIDA, chaves)
+
+
+def conjunto(valores):
+    """Chaves válidas e distintas de `valores`, ordenadas (formato esperado por contem)."""
+    if isinstance(valores, np.ndarray) and valores.dtype == np.int64:
+        chaves = valores
+    else:
+        chaves = para_chaves(valores if isinstance(valores, pd.Series) else list(valores))
+    return np.unique(chaves[chaves != INVALIDA])
+
+
+def contem(chaves_ordenadas, chaves):
+    """Máscara booleana: quais `chaves` estão em `chaves_ordenadas` (saída de conjunto)."""
+    chaves = np.asarray(chaves, dtype=np.int64)
+    if len(chaves_ordenadas) == 0:
+        return np.zeros(len(chaves), dtype=bool)
+    posicoes = np.searchsorted(chaves_ordenadas, chaves)
+    posicoes[posicoes == len(chaves_ordenadas)] = 0
+    return (chaves_ordenadas[posicoes] == chaves) & (chaves != INVALIDA)
+
+
+def formatar(chaves):
+    """Lista de CNPJs com 14 dígitos; chaves INVALIDA viram None."""
+    return [f"{c:014d}" if c != INVALIDA else None for c in np.asarray(chaves, dtype=np.int64).tolist()]
+
+
+def assinatura(chaves_ordenadas):
+    """Hash estável de um conjunto de chaves (para chaves de cache e de coalescência)."""
+    return hashlib.sha256(np.ascontiguousarray(chaves_ordenadas, dtype=np.int64).tobytes()).hexdigest()[:24]
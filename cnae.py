@@ -0,0 +1,55 @@
+# Contagem vetorizada de CNAEs (pares código/descrição)
+
+# cnae.py
+#
+# cod_cnae_secundario e cnae_secundario trazem listas separadas por '; ' na mesma ordem:
+# o i-ésimo código corresponde à i-ésima descrição.
+
+import pandas as pd
+
+SEPARADOR = "; "
+COLUNAS_CNAE = {
+    "principal": ("cod_cnae_principal", "cnae_principal"),
+    "secundario": ("cod_cnae_secundario", "cnae_secundario"),
+}
+TIPOS = {"principal": ("principal",), "secundario": ("secundario",), "ambos": ("principal", "secundario")}
+
+
+def _pares(df, coluna_codigo, coluna_descricao):
+    validos = df[coluna_codigo].notna() & df[coluna_descricao].notna()
+    if not validos.any():
+        return pd.DataFrame(columns=["codigo", "descricao"])
+    partes = []
+    for coluna, nome in ((coluna_codigo, "codigo"), (coluna_descricao, "descricao")):
+        lista = df.loc[validos, coluna].astype(str).str.split(SEPARADOR).reset_index(drop=True).explode()
+        parte = lista.str.strip().rename(nome).to_frame()
+        # Posição dentro da lista da linha: é por ela que código e descrição são emparelhados
+        parte["linha"] = parte.index
+        parte["posicao"] = parte.groupby(level=0).cumcount()
+        partes.append(parte.reset_index(drop=True))
+    # inner join: linhas com mais códigos que descrições (ou o contrário) ficam com o menor número de pares
+    pares = partes[0].merge(partes[1], on=["linha", "posicao"], sort=False)
+    pares = pares[(pares["codigo"] != "") & (pares["descricao"] != "")]
+    return pares.sort_values(["linha", "posicao"], kind="stable")[["codigo", "descricao"]]
+
+
+def contar_cnaes(df, tipo="ambos"):
+    """
+    Frequência dos pares (código, descrição) de CNAE do `tipo` ('principal', 'secundario' ou 'ambos').
+    DataFrame com 'codigo', 'descricao' e 'frequencia', do mais para o menos frequente; empates ficam
+    na ordem da primeira ocorrência. Colunas ausentes em `df` são ignoradas.
+    """
+    pares = [
+        _pares(df, *COLUNAS_CNAE[t]) for t in TIPOS[tipo]
+        if all(c in df.columns for c in COLUNAS_CNAE[t])
+    ]
+    pares = pd.concat(pares, ignore_index=True) if pares else pd.DataFrame(columns=["codigo", "descricao"])
+    if pares.empty:
+        return pd.DataFrame(columns=["codigo", "descricao", "frequencia"])
+    contagem = pares.groupby(["codigo", "descricao"], sort=False).size().rename("frequencia").reset_index()
+    return contagem.sort_values("frequencia", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def top_cnaes(df, tipo, top_n):
+    """Lista dos `top_n` pares (código, descrição) mais frequentes."""
+    return list(contar_cnaes(df, tipo)[["codigo", "descricao"]].head(top_n).itertuples(index=False, name=None))
@@ -0,0 +1,74 @@
+# Coalescência de consultas idênticas em andamento (single-flight)
+
+# coalescencia.py
+#
+# Quem chama executar_uma_vez com a mesma chave enquanto uma execução está em andamento não dispara
+# outra: espera a primeira (a "líder") e recebe uma cópia do mesmo resultado. O registro é do processo,
+# então vale entre sessões e entre as threads de tarefas.py.
+
+import threading
+
+import pandas as pd
+
+from tarefas import cancelamento_solicitado
+
+INTERVALO_ESPERA = 0.5  # segundos entre verificações de cancelamento de quem espera
+
+
+class _Execucao:
+    def __init__(self):
+        self.concluida = threading.Event()
+        self.resultado = None
+        self.erro = None
+        self.abandonada = False
+
+
+_execucoes = {}
+_lock = threading.Lock()
+
+
+def _copiar(resultado):
+    # Cada chamador recebe o seu DataFrame: ninguém altera o resultado de outra sessão
+    if isinstance(resultado, pd.DataFrame):
+        return resultado.copy()
+    if isinstance(resultado, tuple):
+        return tuple(_copiar(r) for r in resultado)
+    return resultado
+
+
+def executar_uma_vez(chave, funcao, *args, **kwargs):
+    """
+    Executa `funcao(*args, **kwargs)` uma única vez por `chave` entre chamadas concorrentes.
+    Um erro da líder é repassado a quem esperava, exceto quando ela foi cancelada pelo próprio
+    usuário (tarefas.cancelar_tarefa): aí um dos que esperavam assume a execução.
+    Quem espera dentro de uma tarefa cancelada desiste sem afetar a execução em andamento.
+    """
+    while True:
+        with _lock:
+            execucao = _execucoes.get(chave)
+            lider = execucao is None
+            if lider:
+                execucao = _execucoes[chave] = _Execucao()
+
+        if lider:
+            try:
+                execucao.resultado = funcao(*args, **kwargs)
+                return execucao.resultado
+            except Exception as e:
+                execucao.erro = e
+                execucao.abandonada = cancelamento_solicitado()
+                raise
+            finally:
+                with _lock:
+                    _execucoes.pop(chave, None)
+                execucao.concluida.set()
+
+        while not execucao.concluida.wait(INTERVALO_ESPERA):
+            if cancelamento_solicitado():
+                raise RuntimeError("Consulta cancelada.")
+        if execucao.abandonada:
+            continue
+        if execucao.erro is not None:
+            raise execucao.erro
+        return _copiar(execucao.resultado)
+
@@ -0,0 +1,41 @@
+# Colunas da visao_empresa_agrupada_base por caso de uso (no lugar de SELECT *)
+
+# colunas.py
+#
+# As colunas *_normalizado existem só para os filtros (WHERE) e nunca precisam voltar para o app.
+
+import hashlib
+
+COLUNAS_CADASTRO = [
+    'cnpj', 'razao_social', 'nome_fantasia', 'identificador_matriz_filial', 'data_inicio_atividade',
+    'capital_social', 'cod_cnae_principal', 'cnae_principal', 'cod_cnae_secundario', 'cnae_secundario',
+    'porte_empresa', 'natureza_juridica', 'opcao_simples', 'opcao_mei', 'motivo', 'situacao_cadastral',
+    'data_situacao_cadastral', 'uf', 'municipio', 'bairro', 'logradouro', 'numero', 'complemento', 'cep',
+    'latitude', 'longitude', 'ddd1', 'telefone1', 'ddd2', 'telefone2', 'email',
+]
+COLUNAS_SOCIOS = ['qtde_socios', 'nomes_socios', 'cpfs_socios', 'datas_entrada', 'qualificacoes', 'faixas_etarias']
+
+COLUNAS_POR_USO = {
+    # Navegação na tela: sem CPFs e datas de entrada dos sócios
+    "preview": COLUNAS_CADASTRO + ['qtde_socios', 'nomes_socios', 'qualificacoes', 'faixas_etarias'],
+    # Arquivos baixados pelo usuário; os mesmos DataFrames da sessão alimentam as análises e o mapa
+    "exportacao": COLUNAS_CADASTRO + COLUNAS_SOCIOS,
+    # Colunas gravadas em tb_leads_gerados (hoje iguais às de exportação; seguem o schema da tabela)
+    "leads": COLUNAS_CADASTRO + COLUNAS_SOCIOS,
+}
+
+
+def colunas(uso):
+    """Lista de colunas do caso de uso ('preview', 'exportacao' ou 'leads')."""
+    return list(COLUNAS_POR_USO[uso])
+
+
+def lista_select(uso, alias=None):
+    """Lista para o SELECT, opcionalmente qualificada com o alias da tabela/view."""
+    prefixo = f"{alias}." if alias else ""
+    return ", ".join(f"{prefixo}{c}" for c in COLUNAS_POR_USO[uso])
+
+
+def assinatura(uso):
+    """Identificador curto do conjunto de colunas, para invalidar caches quando a lista muda."""
+    return hashlib.md5(",".join(COLUNAS_POR_USO[uso]).encode("utf-8")).hexdigest()[:8]
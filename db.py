@@ -0,0 +1,268 @@
+# Acesso ao banco de dados compartilhado por todas as páginas
+
+# db.py
+
+import io
+import os
+import struct
+from contextlib import contextmanager
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine, inspect, text
+
+from chaves_cnpj import conjunto, formatar
+
+# --- CONFIGURAÇÃO DO POOL (sobrescrevível por variáveis de ambiente) ---
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))      # segundos aguardando conexão livre
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))    # segundos até reciclar a conexão
+
+# --- TIMEOUTS DE STATEMENT POR PÁGINA (em ms; 0 desativa) ---
+STATEMENT_TIMEOUT_PADRAO = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "60000"))
+STATEMENT_TIMEOUTS = {
+    "upload_cnpjs": 120000,
+    "upload_oportunidades": 120000,
+    "pesquisa_mercado": 90000,
+    "ia_generator": 180000,
+    "leads_gerados": 180000,
+}
+
+# --- LEITURA EM BLOCOS ---
+TAMANHO_BLOCO_PADRAO = int(os.getenv("DB_TAMANHO_BLOCO", "10000"))
+
+# --- GRAVAÇÃO EM MASSA ---
+TABELA_LEADS = "tb_leads_gerados"
+TAMANHO_BLOCO_COPY = int(os.getenv("DB_TAMANHO_BLOCO_COPY", "50000"))
+
+# --- EXCLUSÃO DE CNPJs ---
+TABELA_EXCLUSAO = "temp_cnpjs_excluir"
+
+
+def get_database_url():
+    """Lê a URL do banco da variável de ambiente DATABASE_URL ou de st.secrets."""
+    url = os.getenv("DATABASE_URL")
+    if url:
+        return url
+    try:
+        return st.secrets["DATABASE_URL"]
+    except Exception:
+        return ""
+
+
+def get_statement_timeout(pagina=None):
+    """Retorna o statement_timeout (ms) da página, permitindo DB_STATEMENT_TIMEOUT_<PAGINA> no ambiente."""
+    if pagina is None:
+        return STATEMENT_TIMEOUT_PADRAO
+    padrao = STATEMENT_TIMEOUTS.get(pagina, STATEMENT_TIMEOUT_PADRAO)
+    return int(os.getenv(f"DB_STATEMENT_TIMEOUT_{pagina.upper()}", padrao))
+
+
+@st.cache_resource
+def get_engine():
+    """Engine único por processo: o pool é compartilhado entre todas as sessões e páginas."""
+    return create_engine(
+        get_database_url(),
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+
+@contextmanager
+def conexao(pagina=None):
+    """
+    Abre uma transação com uma conexão do pool e aplica o statement_timeout da página.
+    O SET LOCAL vale só para esta transação, então a conexão volta limpa para o pool.
+    """
+    timeout_ms = get_statement_timeout(pagina)
+    with get_engine().begin() as conn:
+        if timeout_ms:
+            conn.execute(text(f"SET LOCAL statement_timeout = {int(timeout_ms)}"))
+        yield conn
+
+
+def _tipar_bloco(bloco):
+    """Converte colunas object que vieram homogêneas (números, datas) para dtypes nativos."""
+    return bloco.infer_objects()
+
+
+def ler_sql_na_conexao(conn, sql, params=None, tamanho_bloco=TAMANHO_BLOCO_PADRAO, progresso=None):
+    """
+    Executa a consulta em `conn` com cursor nomeado no servidor (stream_results) e monta o DataFrame
+    em blocos de `tamanho_bloco` linhas, sem bufferizar o resultado inteiro no psycopg2.
+    `progresso(linhas_lidas)` é chamado a cada bloco recebido.
+    """
+    consulta = text(sql) if isinstance(sql, str) else sql
+    blocos = []
+    linhas_lidas = 0
+    conn = conn.execution_options(stream_results=True, max_row_buffer=tamanho_bloco)
+    result = conn.execute(consulta, params or {})
+    try:
+        colunas = list(result.keys())
+        while True:
+            linhas = result.fetchmany(tamanho_bloco)
+            if not linhas:
+                break
+            blocos.append(_tipar_bloco(pd.DataFrame.from_records(linhas, columns=colunas, coerce_float=True)))
+            linhas_lidas += len(linhas)
+            if progresso is not None:
+                progresso(linhas_lidas)
+    finally:
+        result.close()
+
+    if not blocos:
+        return pd.DataFrame(columns=colunas)
+    return pd.concat(blocos, ignore_index=True)
+
+
+def ler_sql_em_blocos(sql, params=None, pagina=None, tamanho_bloco=TAMANHO_BLOCO_PADRAO, progresso=None):
+    """
+    Como `ler_sql_na_conexao`, numa transação própria com o statement_timeout da página.
+    A conexão é devolvida ao pool ao final, mesmo em caso de erro.
+    """
+    with conexao(pagina) as conn:
+        return ler_sql_na_conexao(conn, sql, params, tamanho_bloco, progresso)
+
+
+def _lista_colunas(colunas):
+    return ", ".join(f'"{c}"' for c in colunas)
+
+
+def _coluna_para_copy(serie):
+    # Categorias voltam ao tipo dos valores; números inteiros guardados como float (NaN força float64,
+    # ex.: qtde_socios com nulos) viram Int64, senão o CSV traria "3.0" e o COPY numa coluna integer falharia
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        serie = serie.astype(serie.cat.categories.dtype)
+    if serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) in ("floating", "mixed-integer-float"):
+        serie = pd.to_numeric(serie)
+    if pd.api.types.is_float_dtype(serie):
+        preenchidos = serie.dropna()
+        if (preenchidos % 1 == 0).all() and (preenchidos.abs() < 2 ** 63).all():
+            serie = serie.astype("Int64")
+    return serie
+
+
+def buffer_csv_copy(df):
+    """Buffer CSV (sem cabeçalho) de `df` no formato lido pelo COPY de copiar_dataframe."""
+    buffer = io.StringIO()
+    pd.DataFrame({c: _coluna_para_copy(df[c]) for c in df.columns}).to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    return buffer
+
+
+def copiar_dataframe(conn, df, tabela, tamanho_bloco=TAMANHO_BLOCO_COPY):
+    """
+    Envia o DataFrame para `tabela` com COPY ... FROM STDIN (CSV), em blocos de `tamanho_bloco` linhas.
+    Valores nulos (NaN/None) e strings vazias chegam como NULL.
+    """
+    # FORCE_NULL: o pandas escreve o nulo de um frame de uma coluna só como "" (aspas), que o COPY leria como ''
+    lista = _lista_colunas(df.columns)
+    comando = f"COPY {tabela} ({lista}) FROM STDIN WITH (FORMAT csv, FORCE_NULL ({lista}))"
+    cursor = conn.connection.cursor()
+    try:
+        for inicio in range(0, len(df), tamanho_bloco):
+            cursor.copy_expert(comando, buffer_csv_copy(df.iloc[inicio:inicio + tamanho_bloco]))
+    finally:
+        cursor.close()
+
+
+def nome_indice_unico_leads(tabela=TABELA_LEADS):
+    return f"ux_{tabela}_cliente_cnpj"
+
+
+def indice_unico_leads_existe(conn, tabela=TABELA_LEADS):
+    """True se o índice único (cliente_referencia, cnpj) usado pelo ON CONFLICT existe no schema atual."""
+    return conn.execute(
+        text("""
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = current_schema() AND tablename = :tabela AND indexname = :indice
+        """),
+        {"tabela": tabela, "indice": nome_indice_unico_leads(tabela)},
+    ).first() is not None
+
+
+def criar_indice_unico_leads(conn, tabela=TABELA_LEADS):
+    """
+    Cria o índice único (cliente_referencia, cnpj). Não mexe nos dados: com duplicatas na tabela o
+    CREATE falha; a limpeza é feita uma única vez por `python migracoes.py indice-leads`.
+    """
+    conn.execute(text(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {nome_indice_unico_leads(tabela)} ON {tabela} (cliente_referencia, cnpj)"
+    ))
+
+
+def salvar_leads_em_massa(conn, df, tabela=TABELA_LEADS):
+    """
+    Grava os leads via COPY numa tabela temporária de staging e faz o merge em `tabela`
+    com um único INSERT ... ON CONFLICT (cliente_referencia, cnpj) DO NOTHING,
+    dentro da transação de `conn`. Só as colunas que existem na tabela de destino são enviadas.
+    Retorna (inseridos, ignorados), onde ignorados são os CNPJs já salvos para o mesmo cliente.
+    """
+    colunas_tabela = {col["name"] for col in inspect(conn).get_columns(tabela)}
+    colunas = [c for c in df.columns if c in colunas_tabela and c != "id"]
+    if df.empty or not colunas:
+        return 0, 0
+
+    staging = f"stg_{tabela}"
+    lista = _lista_colunas(colunas)
+    conn.execute(text(f"DROP TABLE IF EXISTS {staging}"))
+    conn.execute(text(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS SELECT {lista} FROM {tabela} WITH NO DATA"))
+    copiar_dataframe(conn, df[colunas], staging)
+    result = conn.execute(text(f"""
+        INSERT INTO {tabela} ({lista})
+        SELECT {lista} FROM {staging}
+        ON CONFLICT (cliente_referencia, cnpj) DO NOTHING
+    """))
+    inseridos = result.rowcount
+    return inseridos, len(df) - inseridos
+
+
+def _buffer_copy_binario(valores):
+    """Monta um buffer no formato binário do COPY (uma coluna de texto por linha)."""
+    partes = [b"PGCOPY\n\xff\r\n\x00", struct.pack("!ii", 0, 0)]
+    for valor in valores:
+        dado = valor.encode("utf-8")
+        partes.append(struct.pack("!hi", 1, len(dado)))
+        partes.append(dado)
+    partes.append(struct.pack("!h", -1))
+    return io.BytesIO(b"".join(partes))
+
+
+def carregar_tabela_exclusao(conn, cnpjs, tabela=TABELA_EXCLUSAO):
+    """
+    Cria a tabela temporária `tabela` (cnpj TEXT) e carrega os CNPJs distintos via COPY binário.
+    Depois da carga cria o índice único e roda ANALYZE para o planner enxergar o tamanho real.
+    A tabela some no fim da transação. Retorna a quantidade de CNPJs carregados.
+    """
+    distintos = formatar(conjunto(cnpjs))
+    conn.execute(text(f"DROP TABLE IF EXISTS {tabela}"))
+    conn.execute(text(f"CREATE TEMP TABLE {tabela} (cnpj TEXT NOT NULL) ON COMMIT DROP"))
+    if distintos:
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(f"COPY {tabela} (cnpj) FROM STDIN WITH (FORMAT binary)", _buffer_copy_binario(distintos))
+        finally:
+            cursor.close()
+    conn.execute(text(f"CREATE UNIQUE INDEX ON {tabela} (cnpj)"))
+    conn.execute(text(f"ANALYZE {tabela}"))
+    return len(distintos)
+
+
+def clausula_anti_join(coluna_cnpj, tabela=TABELA_EXCLUSAO):
+    """Condição NOT EXISTS contra a tabela de exclusão (anti-join, em vez de NOT IN)."""
+    return f"NOT EXISTS (SELECT 1 FROM {tabela} ex WHERE ex.cnpj = {coluna_cnpj})"
+
+
+def clausula_anti_join_array(coluna_cnpj, nome_param):
+    """
+    Condição NOT EXISTS contra um único parâmetro text[] com os CNPJs a excluir.
+    O SQL gerado tem o mesmo tamanho qualquer que seja a quantidade de CNPJs.
+    """
+    return (
+        f"NOT EXISTS (SELECT 1 FROM unnest(CAST(:{nome_param} AS text[])) AS ex(cnpj) "
+        f"WHERE ex.cnpj = {coluna_cnpj})"
+    )
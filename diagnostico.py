@@ -0,0 +1,144 @@
+# Modo diagnóstico: captura de EXPLAIN (ANALYZE, BUFFERS) das consultas geradas
+
+# diagnostico.py
+
+import json
+import os
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+TABELA_BASE = "visao_empresa_agrupada_base"
+LOG_PATH = os.getenv(
+    "DIAGNOSTICO_LOG_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "planos.jsonl"),
+)
+MAX_PLANOS_SESSAO = 20
+
+# A base e, se ela for view, as relações de que ela depende (views aninhadas inclusive): num plano de uma
+# view comum só as tabelas de origem aparecem como "Relation Name"
+SQL_RELACOES_BASE = """
+    WITH RECURSIVE relacoes(oid) AS (
+        SELECT oid FROM pg_class WHERE oid = to_regclass(:tabela)
+        UNION
+        SELECT d.refobjid
+        FROM relacoes rel
+        JOIN pg_rewrite r ON r.ev_class = rel.oid
+        JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid
+        WHERE d.refclassid = 'pg_class'::regclass AND d.refobjid <> rel.oid
+    )
+    SELECT c.relname FROM relacoes rel JOIN pg_class c ON c.oid = rel.oid
+"""
+
+
+def modo_diagnostico_ativo(key="modo_diagnostico"):
+    """Checkbox na barra lateral para ligar o modo diagnóstico (desligado por padrão)."""
+    return st.sidebar.checkbox(
+        "🩺 Modo diagnóstico (EXPLAIN ANALYZE)",
+        value=False,
+        key=key,
+        help="Executa a consulta gerada mais uma vez sob EXPLAIN (ANALYZE, BUFFERS) e mostra o plano.",
+    )
+
+
+def _percorrer(no, nos, profundidade=0):
+    filhos = no.get("Plans", [])
+    loops = no.get("Actual Loops", 1) or 1
+    tempo_total = no.get("Actual Total Time", 0.0) * loops
+    tempo_filhos = sum(f.get("Actual Total Time", 0.0) * (f.get("Actual Loops", 1) or 1) for f in filhos)
+    nos.append({
+        "nó": ("  " * profundidade) + no.get("Node Type", "?"),
+        "tipo": no.get("Node Type", "?"),
+        "relação": no.get("Relation Name"),
+        "tempo_total_ms": round(tempo_total, 2),
+        "tempo_proprio_ms": round(max(tempo_total - tempo_filhos, 0.0), 2),
+        "linhas": no.get("Actual Rows", 0) * loops,
+        "linhas_estimadas": no.get("Plan Rows"),
+        "buffers_hit": no.get("Shared Hit Blocks", 0),
+        "buffers_read": no.get("Shared Read Blocks", 0),
+    })
+    for filho in filhos:
+        _percorrer(filho, nos, profundidade + 1)
+
+
+def relacoes_base(conn, tabela=TABELA_BASE):
+    """Nomes de `tabela` e das tabelas/views por trás dela, se for uma view."""
+    return {tabela} | {nome for (nome,) in conn.execute(text(SQL_RELACOES_BASE), {"tabela": tabela})}
+
+
+def resumir_plano(plano_json, sql, relacoes=frozenset({TABELA_BASE})):
+    """
+    Extrai tempos, linhas, buffers, o nó mais lento e os seq scans de um plano EXPLAIN em JSON.
+    `relacoes` são os nomes que contam como a base (relacoes_base) para o aviso de seq scan.
+    """
+    raiz = plano_json["Plan"]
+    nos = []
+    _percorrer(raiz, nos)
+    mais_lento = max(nos, key=lambda n: n["tempo_proprio_ms"]) if nos else None
+    seq_scans = [n for n in nos if n["tipo"] in ("Seq Scan", "Parallel Seq Scan")]
+    return {
+        "quando": datetime.now().isoformat(timespec="seconds"),
+        "sql": sql,
+        "tempo_execucao_ms": plano_json.get("Execution Time"),
+        "tempo_planejamento_ms": plano_json.get("Planning Time"),
+        "linhas": raiz.get("Actual Rows", 0),
+        "buffers_hit": raiz.get("Shared Hit Blocks", 0),
+        "buffers_read": raiz.get("Shared Read Blocks", 0),
+        "no_mais_lento": mais_lento,
+        "seq_scans": seq_scans,
+        "seq_scan_na_base": sorted({n["relação"] for n in seq_scans if n["relação"] in relacoes}),
+        "nos": nos,
+        "plano": plano_json,
+    }
+
+
+def explicar_consulta(conn, consulta, params=None):
+    """
+    Executa a consulta sob EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) na conexão informada
+    (necessário quando ela depende de tabelas temporárias da mesma transação).
+    """
+    sql = (consulta if isinstance(consulta, str) else str(consulta)).strip().rstrip(";")
+    plano = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"), params or {}).scalar()
+    if isinstance(plano, str):
+        plano = json.loads(plano)
+    return resumir_plano(plano[0], sql, relacoes_base(conn))
+
+
+def registrar_plano(resumo, origem):
+    """Guarda o plano no histórico da sessão e no log local (JSON Lines)."""
+    resumo = dict(resumo, origem=origem)
+    historico = st.session_state.setdefault("planos_diagnostico", [])
+    historico.append(resumo)
+    del historico[:-MAX_PLANOS_SESSAO]
+    try:
+        os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+        with open(LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(resumo, ensure_ascii=False, default=str) + "\n")
+    except OSError:
+        pass
+    return resumo
+
+
+def painel_plano(resumo):
+    """Mostra o resumo do plano: tempos, buffers, nó mais lento e seq scans sobre a base."""
+    with st.expander("🩺 Plano de execução (EXPLAIN ANALYZE)", expanded=True):
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Execução", f"{resumo['tempo_execucao_ms'] or 0:,.0f} ms")
+        col2.metric("Planejamento", f"{resumo['tempo_planejamento_ms'] or 0:,.1f} ms")
+        col3.metric("Linhas", f"{resumo['linhas']:,}")
+        col4.metric("Buffers (hit / read)", f"{resumo['buffers_hit']:,} / {resumo['buffers_read']:,}")
+
+        lento = resumo["no_mais_lento"]
+        if lento:
+            relacao = f" em {lento['relação']}" if lento["relação"] else ""
+            st.markdown(f"**Nó mais lento:** {lento['tipo']}{relacao} — {lento['tempo_proprio_ms']:,.1f} ms próprios, {lento['linhas']:,} linhas")
+        if resumo["seq_scan_na_base"]:
+            origem = ", ".join(f"'{r}'" for r in resumo["seq_scan_na_base"])
+            st.warning(f"Sequential scan sobre '{TABELA_BASE}' ({origem}): algum filtro não está usando índice.")
+        elif resumo["seq_scans"]:
+            st.info("Sequential scans: " + ", ".join(sorted({n["relação"] or "?" for n in resumo["seq_scans"]})))
+
+        st.dataframe(pd.DataFrame(resumo["nos"]).drop(columns=["tipo"]), use_container_width=True)
+        st.json(resumo["plano"], expanded=False)
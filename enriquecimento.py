@@ -0,0 +1,221 @@
+# Enriquecimento de listas de CNPJs em lotes paralelos
+
+# enriquecimento.py
+
+import hashlib
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+import streamlit as st
+from sqlalchemy import text
+
+from chaves_cnpj import INVALIDA, formatar, para_chaves
+from colunas import assinatura, lista_select
+from db import conexao
+
+TABELA_BASE = "visao_empresa_agrupada_base"
+
+# --- CONFIGURAÇÃO DOS LOTES (sobrescrevível por variáveis de ambiente) ---
+TAMANHO_LOTE = int(os.getenv("ENRIQUECIMENTO_TAMANHO_LOTE", "20000"))
+WORKERS = int(os.getenv("ENRIQUECIMENTO_WORKERS", "4"))
+
+# --- CACHE LOCAL POR CNPJ ---
+# Um diretório por versão da base com arquivos Parquet (um por gravação, consolidados de tempos em tempos);
+# as colunas são as do SELECT de exportação mais _encontrado e _gravado_em.
+CACHE_DIR = os.getenv(
+    "ENRIQUECIMENTO_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "enriquecimento"),
+)
+CACHE_MAX_ARQUIVOS = int(os.getenv("ENRIQUECIMENTO_CACHE_MAX_ARQUIVOS", "20"))
+CACHE_TTL_HORAS = float(os.getenv("ENRIQUECIMENTO_CACHE_TTL_HORAS", "168"))
+# Muda sempre que a base é recarregada: REFRESH troca o filenode e o REFRESH CONCURRENTLY mexe nos contadores.
+# Para uma view comum o resultado é vazio e só o TTL invalida o cache.
+SQL_VERSAO_BASE = os.getenv("ENRIQUECIMENTO_SQL_VERSAO_BASE", f"""
+    SELECT concat_ws(':', pg_relation_filenode(c.oid), s.n_tup_ins, s.n_tup_upd, s.n_tup_del)
+    FROM pg_class c
+    LEFT JOIN pg_stat_all_tables s ON s.relid = c.oid
+    WHERE c.relname = '{TABELA_BASE}'
+""")
+
+
+def normalizar_cnpjs(cnpjs):
+    """
+    Remove máscara, completa com zeros à esquerda até 14 dígitos e descarta inválidos e duplicados,
+    mantendo a ordem do upload. Retorna (lista de CNPJs válidos, quantidade descartada).
+    """
+    chaves = para_chaves(cnpjs if isinstance(cnpjs, pd.Series) else list(cnpjs))
+    validos = pd.unique(chaves[chaves != INVALIDA])
+    return formatar(validos), len(chaves) - len(validos)
+
+
+def _buscar_lote(lote):
+    query = text(f"""
+        SELECT {lista_select("exportacao", "v")}
+        FROM {TABELA_BASE} v
+        JOIN unnest(CAST(:cnpjs AS text[])) AS temp(cnpj) ON v.cnpj = temp.cnpj
+    """)
+    with conexao("upload_cnpjs") as conn:
+        return pd.read_sql(query, conn, params={"cnpjs": lote})
+
+
+@st.cache_data(ttl=300)
+def versao_base():
+    """Identificador da carga atual da base, usado para invalidar o cache local."""
+    try:
+        with conexao("upload_cnpjs") as conn:
+            return str(conn.execute(text(SQL_VERSAO_BASE)).scalar() or "")
+    except Exception:
+        return ""
+
+
+def _diretorio_versao(versao):
+    return os.path.join(CACHE_DIR, hashlib.sha256(versao.encode("utf-8")).hexdigest()[:24])
+
+
+def _arquivos_cache(diretorio):
+    try:
+        return sorted(
+            os.path.join(diretorio, nome) for nome in os.listdir(diretorio) if nome.endswith(".parquet")
+        )
+    except FileNotFoundError:
+        return []
+
+
+def _ler_arquivos(arquivos, filtros=None):
+    partes = []
+    for arquivo in arquivos:
+        try:
+            partes.append(pd.read_parquet(arquivo, filters=filtros))
+        except Exception:
+            # Arquivo apagado por uma consolidação concorrente ou corrompido: só perde os acertos dele
+            continue
+    partes = [p for p in partes if not p.empty]
+    return pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+
+
+def _validos(df):
+    """Linhas dentro do TTL, uma por CNPJ (a gravação mais recente)."""
+    if df.empty:
+        return df
+    df = df[df["_gravado_em"] >= time.time() - CACHE_TTL_HORAS * 3600]
+    return df.sort_values("_gravado_em", kind="stable").drop_duplicates("cnpj", keep="last")
+
+
+def _gravar_parquet(diretorio, df):
+    # Nome temporário com ponto inicial: leitores do diretório não o enxergam até o os.replace
+    os.makedirs(diretorio, exist_ok=True)
+    nome = f"{time.time():.6f}-{uuid.uuid4().hex}.parquet"
+    temporario = os.path.join(diretorio, f".{nome}.tmp")
+    try:
+        df.to_parquet(temporario, index=False)
+        os.replace(temporario, os.path.join(diretorio, nome))
+        return True
+    except Exception:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        return False
+
+
+def ler_cache(cnpjs, versao):
+    """
+    Procura os CNPJs no cache local válidos para `versao` e dentro do TTL.
+    Retorna (DataFrame com os acertos, lista de CNPJs que precisam ir ao banco).
+    CNPJs já procurados e inexistentes na base contam como acerto, sem linha no DataFrame.
+    """
+    arquivos = _arquivos_cache(_diretorio_versao(versao))
+    if not arquivos or not cnpjs:
+        return pd.DataFrame(), list(cnpjs)
+    df = _validos(_ler_arquivos(arquivos, filtros=[("cnpj", "in", list(cnpjs))]))
+    if df.empty:
+        return pd.DataFrame(), list(cnpjs)
+    conhecidos = set(df["cnpj"])
+    encontrados = df[df["_encontrado"].astype(bool)].drop(columns=["_encontrado", "_gravado_em"])
+    return encontrados.reset_index(drop=True), [c for c in cnpjs if c not in conhecidos]
+
+
+def gravar_cache(df, cnpjs_buscados, versao):
+    """
+    Grava no cache as linhas de `df` e marca como inexistentes os CNPJs buscados que não voltaram.
+    Apaga os diretórios de outras versões da base e consolida os arquivos da versão atual quando passam
+    de CACHE_MAX_ARQUIVOS.
+    """
+    ausentes = pd.Index(cnpjs_buscados).difference(pd.Index(df["cnpj"]) if not df.empty else pd.Index([]))
+    novos = pd.concat([
+        df.assign(_encontrado=True),
+        pd.DataFrame({"cnpj": ausentes.astype(str), "_encontrado": False}),
+    ], ignore_index=True)
+    novos["_gravado_em"] = time.time()
+
+    diretorio = _diretorio_versao(versao)
+    if not _gravar_parquet(diretorio, novos):
+        return
+
+    if os.path.isdir(CACHE_DIR):
+        for nome in os.listdir(CACHE_DIR):
+            caminho = os.path.join(CACHE_DIR, nome)
+            if caminho != diretorio and os.path.isdir(caminho):
+                shutil.rmtree(caminho, ignore_errors=True)
+
+    arquivos = _arquivos_cache(diretorio)
+    if len(arquivos) > CACHE_MAX_ARQUIVOS:
+        # Só os arquivos lidos aqui são apagados; o que outra sessão gravar no meio do caminho fica
+        if _gravar_parquet(diretorio, _validos(_ler_arquivos(arquivos))):
+            for arquivo in arquivos:
+                try:
+                    os.remove(arquivo)
+                except OSError:
+                    pass
+
+
+def _buscar_em_lotes(cnpjs, tamanho_lote, workers, progresso):
+    lotes = [cnpjs[i:i + tamanho_lote] for i in range(0, len(cnpjs), tamanho_lote)]
+    resultados = []
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(lotes) or 1))) as executor:
+        futuros = [executor.submit(_buscar_lote, lote) for lote in lotes]
+        for concluidos, futuro in enumerate(as_completed(futuros), start=1):
+            resultados.append(futuro.result())
+            if progresso is not None:
+                progresso(concluidos, len(lotes))
+    return [df for df in resultados if not df.empty]
+
+
+def enriquecer_cnpjs(cnpjs, tamanho_lote=TAMANHO_LOTE, workers=WORKERS, progresso=None, usar_cache=True):
+    """
+    Busca os dados da base para uma lista já normalizada de CNPJs. Com `usar_cache`, só os CNPJs
+    ausentes do cache local (ou de uma carga anterior da base) vão ao Postgres.
+    As buscas são divididas em lotes de `tamanho_lote` executados em paralelo por `workers` threads
+    (cada uma com sua conexão do pool). O resultado volta na ordem do upload.
+    `progresso(lotes_concluidos, total_lotes)` é chamado na thread de quem chamou a função.
+    """
+    cnpjs = list(cnpjs)
+    if not cnpjs:
+        return pd.DataFrame()
+
+    resultados = []
+    faltantes = cnpjs
+    if usar_cache:
+        # A lista de colunas entra na versão: mudar o SELECT invalida o que já está no cache
+        versao = f"{versao_base()}|{assinatura('exportacao')}"
+        df_cache, faltantes = ler_cache(cnpjs, versao)
+        if not df_cache.empty:
+            resultados.append(df_cache)
+
+    if faltantes:
+        novos = _buscar_em_lotes(faltantes, tamanho_lote, workers, progresso)
+        if usar_cache:
+            gravar_cache(pd.concat(novos, ignore_index=True) if novos else pd.DataFrame(columns=["cnpj"]), faltantes, versao)
+        resultados.extend(novos)
+
+    if not resultados:
+        return pd.DataFrame()
+    df = pd.concat(resultados, ignore_index=True)
+
+    ordem = pd.Series(range(len(cnpjs)), index=cnpjs)
+    df["_ordem_upload"] = df["cnpj"].map(ordem)
+    return df.sort_values("_ordem_upload", kind="stable").drop(columns="_ordem_upload").reset_index(drop=True)
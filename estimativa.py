@@ -0,0 +1,91 @@
+# Pré-verificação do tamanho do resultado antes de executar a consulta
+
+# estimativa.py
+
+import json
+import os
+
+import streamlit as st
+from sqlalchemy import text
+
+from db import conexao
+
+# Acima destes limites a página pede confirmação antes de buscar os dados
+LINHAS_AVISO = int(os.getenv("ESTIMATIVA_LINHAS_AVISO", "20000"))
+BYTES_AVISO = int(os.getenv("ESTIMATIVA_BYTES_AVISO", str(50 * 1024 * 1024)))
+# COUNT exato só quando o planner estima a consulta como barata (unidades de custo do Postgres)
+CUSTO_MAXIMO_CONTAGEM = float(os.getenv("ESTIMATIVA_CUSTO_MAXIMO_CONTAGEM", "50000"))
+
+
+def _sql_sem_ponto_e_virgula(consulta):
+    return (consulta if isinstance(consulta, str) else str(consulta)).strip().rstrip(";")
+
+
+def estimar_resultado(sql, params=None, pagina=None):
+    """
+    Estima linhas e tamanho do resultado sem buscá-lo: usa as estimativas do EXPLAIN e, se o
+    custo for baixo, troca as linhas por um COUNT exato (limitado pelo próprio LIMIT da consulta).
+    Retorna dict com 'linhas', 'exato', 'bytes' (linhas x largura média estimada) e 'custo'.
+    """
+    sql = _sql_sem_ponto_e_virgula(sql)
+    with conexao(pagina) as conn:
+        plano = conn.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params or {}).scalar()
+        if isinstance(plano, str):
+            plano = json.loads(plano)
+        raiz = plano[0]["Plan"]
+        linhas = int(raiz.get("Plan Rows", 0))
+        largura = int(raiz.get("Plan Width", 0))
+        custo = float(raiz.get("Total Cost", 0.0))
+        exato = False
+        if custo <= CUSTO_MAXIMO_CONTAGEM:
+            linhas = int(conn.execute(text(f"SELECT count(*) FROM ({sql}) AS q"), params or {}).scalar())
+            exato = True
+    return {"linhas": linhas, "exato": exato, "bytes": linhas * largura, "custo": custo}
+
+
+def excede_limites(estimativa):
+    return estimativa["linhas"] > LINHAS_AVISO or estimativa["bytes"] > BYTES_AVISO
+
+
+def _formatar_bytes(n):
+    for unidade in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unidade == "GB":
+            return f"{n:,.0f} {unidade}" if unidade == "B" else f"{n:,.1f} {unidade}"
+        n /= 1024
+
+
+def descrever_estimativa(estimativa):
+    linhas = f"{estimativa['linhas']:,}" if estimativa["exato"] else f"~{estimativa['linhas']:,}"
+    return f"{linhas} linhas, ~{_formatar_bytes(estimativa['bytes'])} a transferir"
+
+
+def confirmar_execucao(chave, estimativa=None):
+    """
+    Pré-verificação com confirmação. Chamada com `estimativa` no clique do botão de consulta e sem ela
+    nas execuções seguintes da página. Retorna True quando a consulta pode seguir: na hora, se a
+    estimativa está dentro dos limites, ou depois que o usuário confirma o aviso. Enquanto o aviso está
+    aberto a estimativa fica em st.session_state[chave]; "Abortar" descarta a consulta.
+    """
+    if estimativa is not None:
+        if not excede_limites(estimativa):
+            st.caption(f"Estimativa do resultado: {descrever_estimativa(estimativa)}.")
+            st.session_state.pop(chave, None)
+            return True
+        st.session_state[chave] = estimativa
+
+    pendente = st.session_state.get(chave)
+    if pendente is None:
+        return False
+
+    st.warning(
+        f"⚠️ Resultado estimado grande: {descrever_estimativa(pendente)}. "
+        "Considere refinar os filtros ou reduzir o limite antes de executar."
+    )
+    col_sim, col_nao = st.columns(2)
+    if col_sim.button("✅ Executar mesmo assim", key=f"{chave}_confirmar"):
+        st.session_state.pop(chave, None)
+        return True
+    if col_nao.button("✖️ Abortar", key=f"{chave}_abortar"):
+        st.session_state.pop(chave, None)
+        st.rerun()
+    return False
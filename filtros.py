@@ -0,0 +1,379 @@
+# Compilador único de filtros -> SQL parametrizado, com impressão digital canônica
+
+# filtros.py
+#
+# Os três montadores de consulta (Consulta Avançada, IA Generator e Re-Gerador) descrevem os filtros
+# como uma EspecFiltro e compilam por aqui. A especificação é canônica por construção (valores
+# normalizados, sem duplicatas, ordenados), então filtros equivalentes geram o mesmo SQL, os mesmos
+# nomes de parâmetro e a mesma impressão digital, que serve de chave para cache e coalescência.
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from unidecode import unidecode
+
+from chaves_cnpj import conjunto, formatar
+from colunas import lista_select
+from db import clausula_anti_join, clausula_anti_join_array
+
+TABELA_BASE = "visao_empresa_agrupada_base"
+
+NULO = "(Nulo)"
+VAZIO = "(Vazio)"
+
+# campo -> (coluna, tipo)
+#   normalizado: coluna *_normalizado (maiúscula, sem acento); o valor é normalizado em Python
+#   maiusculo:   coluna original que já vem em maiúsculas e sem acento da Receita; tratada como normalizada
+#   texto:       coluna original com acentos; comparada via unaccent() (não usa índice trgm)
+#   codigo:      comparado como veio (códigos CNAE)
+#   numero/data: comparações de intervalo/igualdade
+CAMPOS = {
+    'razao_social': ('razao_social_normalizado', 'normalizado'),
+    'nome_fantasia': ('nome_fantasia_normalizado', 'normalizado'),
+    'uf': ('uf_normalizado', 'normalizado'),
+    'municipio': ('municipio_normalizado', 'normalizado'),
+    'bairro': ('bairro_normalizado', 'normalizado'),
+    'cnae_principal': ('cnae_principal_normalizado', 'normalizado'),
+    'natureza_juridica': ('natureza_juridica', 'texto'),
+    'porte_empresa': ('porte_empresa', 'maiusculo'),
+    'opcao_simples': ('opcao_simples', 'maiusculo'),
+    'opcao_mei': ('opcao_mei', 'maiusculo'),
+    'ddd1': ('ddd1', 'maiusculo'),
+    'logradouro': ('logradouro', 'maiusculo'),
+    'nomes_socios': ('nomes_socios', 'texto'),
+    'qualificacoes': ('qualificacoes', 'texto'),
+    'faixas_etarias': ('faixas_etarias', 'texto'),
+    'cod_cnae_principal': ('cod_cnae_principal', 'codigo'),
+    'cod_cnae_secundario': ('cod_cnae_secundario', 'codigo'),
+    'capital_social': ('capital_social', 'numero'),
+    'qtde_socios': ('qtde_socios', 'numero'),
+    'data_inicio_atividade': ('data_inicio_atividade', 'data'),
+}
+
+# "(Nulo)"/"(Vazio)" dos códigos CNAE olham a descrição, como o Re-Gerador sempre fez
+COLUNA_NULO = {
+    'cod_cnae_principal': 'cnae_principal',
+    'cod_cnae_secundario': 'cnae_secundario',
+}
+
+# igual:        coluna = qualquer um dos valores (um único parâmetro array)
+# contem:       coluna ILIKE '%termo%' para qualquer termo (um parâmetro por termo, compatível com índice trgm)
+# item_lista:   termo é um dos itens de uma coluna separada por '|'
+# entre:        valores = (mínimo, máximo), qualquer um pode ser None
+# idade_entre:  idade da empresa em anos entre (mínimo, máximo)
+# cnae_codigo:  CNAE principal igual a um dos códigos ou secundários ILIKE o código (sem curingas)
+OPERADORES = ('igual', 'contem', 'item_lista', 'entre', 'idade_entre', 'cnae_codigo')
+
+
+@dataclass(frozen=True)
+class Condicao:
+    campo: str
+    operador: str
+    valores: tuple = ()
+    incluir_nulo: bool = False
+    incluir_vazio: bool = False
+
+
+@dataclass(frozen=True)
+class EspecFiltro:
+    condicoes: tuple = ()
+    excluir_cnpjs: tuple = ()
+    limite: int = None
+    somente_ativas: bool = True
+
+
+def _normalizar_valor(campo, valor):
+    tipo = CAMPOS[campo][1] if campo in CAMPOS else 'codigo'
+    if tipo in ('normalizado', 'maiusculo', 'texto'):
+        return unidecode(str(valor)).strip().upper()
+    if tipo == 'codigo':
+        return str(valor).strip()
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+
+def condicao(campo, operador, valores):
+    """
+    Monta uma Condicao canônica. Os marcadores "(Nulo)" e "(Vazio)" viram incluir_nulo/incluir_vazio.
+    Para 'entre'/'idade_entre' `valores` é (mínimo, máximo); para os demais, uma lista de valores.
+    Retorna None quando não sobra nada para filtrar.
+    """
+    if operador not in OPERADORES:
+        raise ValueError(f"Operador desconhecido: {operador}")
+    if operador in ('entre', 'idade_entre'):
+        minimo, maximo = valores
+        if minimo is None and maximo is None:
+            return None
+        return Condicao(campo, operador, (_normalizar_valor(campo, minimo) if minimo is not None else None,
+                                          _normalizar_valor(campo, maximo) if maximo is not None else None))
+
+    valores = list(valores or [])
+    incluir_nulo = NULO in valores
+    incluir_vazio = VAZIO in valores
+    normalizados = {
+        _normalizar_valor(campo, v) for v in valores
+        if v not in (NULO, VAZIO) and v is not None and str(v).strip()
+    }
+    if not normalizados and not incluir_nulo and not incluir_vazio:
+        return None
+    return Condicao(campo, operador, tuple(sorted(normalizados, key=str)), incluir_nulo, incluir_vazio)
+
+
+def especificar(condicoes, excluir_cnpjs=(), limite=None, somente_ativas=True):
+    """EspecFiltro canônica: descarta condições vazias, ordena condições e CNPJs excluídos."""
+    condicoes = sorted({c for c in condicoes if c is not None}, key=lambda c: (c.campo, c.operador, repr(c)))
+    cnpjs = tuple(formatar(conjunto(excluir_cnpjs)))
+    return EspecFiltro(tuple(condicoes), cnpjs, int(limite) if limite is not None else None, somente_ativas)
+
+
+def _serializar(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+def impressao_digital(espec):
+    """Hash estável da especificação (os CNPJs excluídos entram como hash do conjunto)."""
+    canonico = {
+        "condicoes": [
+            [c.campo, c.operador, [_serializar(v) for v in c.valores], c.incluir_nulo, c.incluir_vazio]
+            for c in espec.condicoes
+        ],
+        "excluir_cnpjs": hashlib.sha256("\n".join(espec.excluir_cnpjs).encode("utf-8")).hexdigest() if espec.excluir_cnpjs else "",
+        "limite": espec.limite,
+        "somente_ativas": espec.somente_ativas,
+    }
+    texto = json.dumps(canonico, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:24]
+
+
+def _coluna(campo, alias):
+    coluna = CAMPOS[campo][0]
+    return f"{alias}.{coluna}" if alias else coluna
+
+
+def _compilar_condicao(c, indice, alias, params):
+    nome = f"f{indice}"
+    tipo = CAMPOS[c.campo][1] if c.campo in CAMPOS else None
+    partes = []
+
+    if c.operador == 'igual' and c.valores:
+        col = _coluna(c.campo, alias)
+        if tipo == 'numero':
+            partes.append(f"{col} = ANY(CAST(:{nome} AS numeric[]))")
+        else:
+            expr = f"unaccent(upper({col}))" if tipo == 'texto' else col
+            partes.append(f"{expr} = ANY(CAST(:{nome} AS text[]))")
+        params[nome] = list(c.valores)
+
+    elif c.operador == 'contem':
+        col = _coluna(c.campo, alias)
+        expr = f"unaccent({col})" if tipo == 'texto' else col
+        for i, termo in enumerate(c.valores):
+            params[f"{nome}_{i}"] = f"%{termo}%"
+            partes.append(f"{expr} ILIKE :{nome}_{i}")
+
+    elif c.operador == 'item_lista':
+        col = _coluna(c.campo, alias)
+        col = f"unaccent({col})" if tipo == 'texto' else col
+        for i, termo in enumerate(c.valores):
+            params[f"{nome}_{i}"] = f"(^|\\|\\s*){re.escape(termo)}(\\s*\\||$)"
+            partes.append(f"{col} ~* :{nome}_{i}")
+
+    elif c.operador == 'entre':
+        col = _coluna(c.campo, alias)
+        minimo, maximo = c.valores
+        faixa = []
+        if minimo is not None:
+            params[f"{nome}_min"] = minimo
+            faixa.append(f"{col} >= :{nome}_min")
+        if maximo is not None:
+            params[f"{nome}_max"] = maximo
+            faixa.append(f"{col} <= :{nome}_max")
+        partes.append(" AND ".join(faixa))
+
+    elif c.operador == 'idade_entre':
+        idade = f"DATE_PART('year', AGE(CURRENT_DATE, {_coluna('data_inicio_atividade', alias)}))"
+        minimo, maximo = c.valores
+        faixa = []
+        if minimo is not None:
+            params[f"{nome}_min"] = minimo
+            faixa.append(f"{idade} >= :{nome}_min")
+        if maximo is not None:
+            params[f"{nome}_max"] = maximo
+            faixa.append(f"{idade} <= :{nome}_max")
+        partes.append(" AND ".join(faixa))
+
+    elif c.operador == 'cnae_codigo' and c.valores:
+        params[nome] = list(c.valores)
+        params[f"{nome}_sec"] = list(c.valores)
+        partes.append(
+            f"{_coluna('cod_cnae_principal', alias)} = ANY(CAST(:{nome} AS text[])) "
+            f"OR {_coluna('cod_cnae_secundario', alias)} ILIKE ANY(CAST(:{nome}_sec AS text[]))"
+        )
+
+    col = None
+    if c.campo in CAMPOS:
+        col = _coluna_simples(COLUNA_NULO[c.campo], alias) if c.campo in COLUNA_NULO else _coluna(c.campo, alias)
+    if c.incluir_nulo and col:
+        partes.append(f"{col} IS NULL")
+    if c.incluir_vazio and col and tipo not in ('numero', 'data'):
+        partes.append(f"{col} = ''")
+    if not partes:
+        return None
+    return partes[0] if len(partes) == 1 and c.operador in ('entre', 'idade_entre') else f"({' OR '.join(partes)})"
+
+
+def compilar_where(espec, alias=None, exclusao="array"):
+    """
+    Lista de cláusulas (para unir com AND) e dict de parâmetros da especificação.
+    `exclusao`: "array" (um parâmetro text[]) ou "tabela" (anti-join com a tabela temporária de db.py).
+    """
+    params = {}
+    clausulas = []
+    if espec.somente_ativas:
+        clausulas.append(f"{_coluna_simples('situacao_cadastral', alias)} = 'ATIVA'")
+    for indice, c in enumerate(espec.condicoes):
+        clausula = _compilar_condicao(c, indice, alias, params)
+        if clausula:
+            clausulas.append(clausula)
+    if espec.excluir_cnpjs:
+        coluna_cnpj = _coluna_simples('cnpj', alias or TABELA_BASE)
+        if exclusao == "tabela":
+            clausulas.append(clausula_anti_join(coluna_cnpj))
+        else:
+            clausulas.append(clausula_anti_join_array(coluna_cnpj, "excluir_cnpjs"))
+            params["excluir_cnpjs"] = list(espec.excluir_cnpjs)
+    return clausulas, params
+
+
+def _coluna_simples(coluna, alias):
+    return f"{alias}.{coluna}" if alias else coluna
+
+
+def compilar(espec, uso="exportacao", alias=None, exclusao="array", apos_cnpj=None, tamanho_pagina=None):
+    """
+    SQL completo e parâmetros: SELECT com as colunas do caso de uso `uso` (colunas.py),
+    WHERE da especificação e LIMIT. Com `tamanho_pagina`, pagina por keyset em ordem de cnpj
+    a partir de `apos_cnpj` (e ignora o limite da especificação).
+    """
+    clausulas, params = compilar_where(espec, alias, exclusao)
+    origem = f"{TABELA_BASE} {alias}" if alias else TABELA_BASE
+    sql = f"SELECT {lista_select(uso, alias)} FROM {origem}"
+
+    if tamanho_pagina is not None:
+        if apos_cnpj is not None:
+            clausulas.append(f"{_coluna_simples('cnpj', alias)} > :apos_cnpj")
+            params["apos_cnpj"] = apos_cnpj
+        params["tamanho_pagina"] = int(tamanho_pagina)
+        if clausulas:
+            sql += " WHERE " + " AND ".join(clausulas)
+        return sql + f" ORDER BY {_coluna_simples('cnpj', alias)} LIMIT :tamanho_pagina", params
+
+    if clausulas:
+        sql += " WHERE " + " AND ".join(clausulas)
+    if espec.limite is not None:
+        sql += f" LIMIT {int(espec.limite)}"
+    return sql, params
+
+
+def _termos(valores):
+    return [v for v in (valores or []) if v is not None]
+
+
+# Listas de termos da Consulta Avançada (chave no dict de filtros da tela -> (campo, operador))
+PARAMETROS_CONSULTA = {
+    'municipio_termos': ('municipio', 'contem'),
+    'razao_social_termos': ('razao_social', 'contem'),
+    'nome_fantasia_termos': ('nome_fantasia', 'contem'),
+    'cnaes_termos': ('cnae_principal', 'contem'),
+    'natureza_juridica_termos': ('natureza_juridica', 'contem'),
+    'bairro_termos': ('bairro', 'contem'),
+    'ddd_termos': ('ddd1', 'contem'),
+    'logradouro_termos': ('logradouro', 'contem'),
+    'qualificacao_socio_termos': ('qualificacoes', 'item_lista'),
+    'faixa_etaria_socio_termos': ('faixas_etarias', 'item_lista'),
+    'cod_cnae_termos': ('cod_cnae_principal', 'cnae_codigo'),
+}
+
+# Parâmetros de cada gerador de leads -> (campo, operador). Cada gerador mantém os nomes e os
+# operadores que sempre usou: o IA Generator compara CNAE secundário por igualdade, o Re-Gerador
+# procura o código dentro da lista e compara qualificações e faixas etárias por igualdade.
+_PARAMETROS_COMUNS = {
+    'uf': ('uf', 'igual'),
+    'municipio': ('municipio', 'igual'),
+    'bairro': ('bairro', 'igual'),
+    'porte_empresa': ('porte_empresa', 'igual'),
+    'natureza_juridica': ('natureza_juridica', 'igual'),
+    'opcao_simples': ('opcao_simples', 'igual'),
+    'opcao_mei': ('opcao_mei', 'igual'),
+    'ddd1': ('ddd1', 'igual'),
+    'nome_fantasia': ('nome_fantasia', 'contem'),
+    'cod_cnae_principal': ('cod_cnae_principal', 'igual'),
+    'capital_social': ('capital_social', 'entre'),
+    'data_inicio_atividade': ('data_inicio_atividade', 'entre'),
+}
+PARAMETROS_GERADOR = {
+    "ia": {
+        **_PARAMETROS_COMUNS,
+        'qtde_socios': ('qtde_socios', 'igual'),
+        'nome_socio_razao_social': ('nomes_socios', 'contem'),
+        'qualificacao_socio': ('qualificacoes', 'contem'),
+        'faixa_etaria_socio': ('faixas_etarias', 'contem'),
+        'cod_cnae_secundario': ('cod_cnae_secundario', 'igual'),
+    },
+    "regerador": {
+        **_PARAMETROS_COMUNS,
+        'nomes_socios': ('nomes_socios', 'contem'),
+        'qualificacoes': ('qualificacoes', 'igual'),
+        'faixas_etarias': ('faixas_etarias', 'igual'),
+        'cod_cnae_secundario': ('cod_cnae_secundario', 'contem'),
+    },
+}
+
+
+def espec_de_parametros_ia(params, excluir_cnpjs=(), limite=None, gerador="ia"):
+    """
+    EspecFiltro a partir do dict de parâmetros dos geradores de leads.
+    `gerador`: "ia" (IA Generator) ou "regerador" (Re-Gerador), ver PARAMETROS_GERADOR.
+    """
+    mapa = PARAMETROS_GERADOR[gerador]
+    condicoes = []
+    for chave, valor in params.items():
+        if chave not in mapa or valor is None:
+            continue
+        campo, operador = mapa[chave]
+        if operador == 'entre':
+            if isinstance(valor, (list, tuple)) and len(valor) == 2:
+                condicoes.append(condicao(campo, operador, tuple(valor)))
+            continue
+        if chave.startswith('cod_cnae_'):
+            # Lista de (código, descrição)
+            valor = [item[0] if isinstance(item, (list, tuple)) else item for item in valor]
+        if chave == 'qtde_socios':
+            valor = [int(v) if str(v).isdigit() else v for v in valor if str(v).isdigit() or v in (NULO, VAZIO)]
+        condicoes.append(condicao(campo, operador, _termos(valor)))
+    return especificar(condicoes, excluir_cnpjs, limite)
+
+
+# Colunas com valores de menos de 3 caracteres (DDD): não geram trigramas, um índice trgm nunca as atende
+COLUNAS_SEM_TRGM = {'ddd1'}
+
+
+def colunas_ilike():
+    """
+    Colunas que o compilador compara com ILIKE direto na coluna (sem unaccent) em algum dos montadores:
+    são as que um índice GIN gin_trgm_ops consegue atender (indices.py), tirando COLUNAS_SEM_TRGM.
+    """
+    colunas = set()
+    for mapa in (PARAMETROS_CONSULTA, *PARAMETROS_GERADOR.values()):
+        for campo, operador in mapa.values():
+            if operador == 'contem' and CAMPOS[campo][1] != 'texto':
+                colunas.add(CAMPOS[campo][0])
+            elif operador == 'cnae_codigo':
+                colunas.add(CAMPOS['cod_cnae_secundario'][0])
+    return sorted(colunas - COLUNAS_SEM_TRGM)
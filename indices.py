@@ -0,0 +1,150 @@
+# Gerenciamento dos índices trigram (pg_trgm) usados pelos filtros ILIKE
+
+# indices.py
+#
+# Uso:
+#   python indices.py verificar          -> lista quais colunas já têm índice GIN trgm válido
+#   python indices.py criar              -> cria (CONCURRENTLY) os índices que faltam
+#   python indices.py avaliar "<SQL>"    -> mostra quais predicados do SQL podem usar os índices
+
+import re
+import sys
+
+from sqlalchemy import text
+
+from db import get_engine
+from filtros import colunas_ilike
+
+TABELA = "visao_empresa_agrupada_base"
+
+# Colunas que os montadores de filtro comparam com ILIKE direto na coluna (filtros.colunas_ilike).
+# Predicados sobre unaccent(coluna) não usam um índice da coluna pura, então essas ficam de fora.
+COLUNAS_TRGM = colunas_ilike()
+
+# O pg_trgm só consegue usar o índice quando o termo tem pelo menos 3 caracteres
+TAMANHO_MINIMO_TERMO = 3
+
+_RE_PREDICADO = re.compile(
+    r"(?P<expr>(?:unaccent\(\s*(?:upper\(\s*)?)?(?:\w+\.)?(?P<coluna>\w+)\)?\)?)\s+(?P<op>I?LIKE|~\*?)\s+"
+    r"(?P<padrao>ANY\s*\(\s*CAST\(\s*:\w+\s+AS\s+\w+\[\]\s*\)\s*\)|ANY\s*\(\s*ARRAY\[[^\]]*\]\s*\)"
+    r"|unaccent\('[^']*'\)|unaccent\(upper\([^)]*\)\)|'[^']*'|:\w+)",
+    re.IGNORECASE,
+)
+
+
+def nome_indice(coluna, tabela=TABELA):
+    return f"{tabela}_{coluna}_trgm"
+
+
+def verificar_indices(conn, tabela=TABELA):
+    """Retorna {coluna: (nome_do_indice, valido)} para os índices GIN gin_trgm_ops existentes na tabela."""
+    linhas = conn.execute(text("""
+        SELECT a.attname, i.relname, ix.indisvalid
+        FROM pg_index ix
+        JOIN pg_class t ON t.oid = ix.indrelid
+        JOIN pg_class i ON i.oid = ix.indexrelid
+        JOIN pg_am am ON am.oid = i.relam
+        JOIN pg_opclass op ON op.oid = ix.indclass[0]
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ix.indkey[0]
+        WHERE t.relname = :tabela AND am.amname = 'gin' AND op.opcname = 'gin_trgm_ops'
+    """), {"tabela": tabela}).fetchall()
+    return {coluna: (indice, valido) for coluna, indice, valido in linhas}
+
+
+def criar_indices(tabela=TABELA, colunas=COLUNAS_TRGM):
+    """
+    Cria a extensão pg_trgm e os índices GIN que faltam, com CREATE INDEX CONCURRENTLY
+    (fora de transação e sem statement_timeout). Índices inválidos de uma tentativa
+    interrompida são removidos e recriados. Retorna a lista de índices criados.
+    """
+    criados = []
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SET statement_timeout = 0"))
+        relkind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :tabela"), {"tabela": tabela}).scalar()
+        if relkind == 'v':
+            raise RuntimeError(f"'{tabela}' é uma view comum; os índices devem ser criados na tabela ou materialized view de origem.")
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        existentes = verificar_indices(conn, tabela)
+        for coluna in colunas:
+            indice, valido = existentes.get(coluna, (None, False))
+            if indice and valido:
+                continue
+            if indice:
+                conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {indice}"))
+            conn.execute(text(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nome_indice(coluna, tabela)} "
+                f"ON {tabela} USING gin ({coluna} gin_trgm_ops)"
+            ))
+            conn.execute(text(f"ANALYZE {tabela} ({coluna})"))
+            criados.append(nome_indice(coluna, tabela))
+        conn.execute(text("RESET statement_timeout"))
+    return criados
+
+
+def _termos(padrao, params):
+    """Termos (sem os %) comparados por `padrao`: literais do SQL ou valores ligados aos marcadores :nome."""
+    marcador = re.search(r":(\w+)", padrao)
+    if marcador:
+        valor = params.get(marcador.group(1))
+        if valor is None:
+            return []
+        valores = valor if isinstance(valor, (list, tuple)) else [valor]
+    else:
+        valores = re.findall(r"'([^']*)'", padrao)
+    return [str(v).strip("%") for v in valores]
+
+
+def avaliar_predicados(sql, colunas_indexadas, params=None):
+    """
+    Lista os predicados LIKE/ILIKE/regex do SQL gerado (inclusive ILIKE ANY(...)) e se cada um pode usar
+    um índice trgm. Termos passados como parâmetro são lidos de `params` (saída de filtros.compilar).
+    Retorna uma lista de dicts com 'predicado', 'coluna', 'usa_indice' e 'motivo'.
+    """
+    params = params or {}
+    avaliacao = []
+    for m in _RE_PREDICADO.finditer(sql):
+        coluna = m.group("coluna")
+        expr = m.group("expr")
+        termos = _termos(m.group("padrao"), params)
+
+        if expr != coluna and not expr.endswith(f".{coluna}"):
+            usa, motivo = False, "coluna envolvida em função (unaccent/upper) não casa com o índice"
+        elif coluna not in colunas_indexadas:
+            usa, motivo = False, "coluna sem índice trgm"
+        elif any(len(termo) < TAMANHO_MINIMO_TERMO for termo in termos):
+            usa, motivo = False, f"termo com menos de {TAMANHO_MINIMO_TERMO} caracteres"
+        else:
+            usa, motivo = True, "ok"
+        avaliacao.append({"predicado": m.group(0), "coluna": coluna, "usa_indice": usa, "motivo": motivo})
+    return avaliacao
+
+
+def main(argv):
+    comando = argv[1] if len(argv) > 1 else "verificar"
+    if comando == "criar":
+        criados = criar_indices()
+        print("Índices criados:" if criados else "Nenhum índice a criar.")
+        for indice in criados:
+            print(f"  {indice}")
+    elif comando == "verificar":
+        with get_engine().connect() as conn:
+            existentes = verificar_indices(conn)
+        for coluna in COLUNAS_TRGM:
+            indice, valido = existentes.get(coluna, (None, False))
+            situacao = "OK" if indice and valido else ("INVÁLIDO" if indice else "FALTANDO")
+            print(f"{coluna:32} {situacao:9} {indice or ''}")
+    elif comando == "avaliar" and len(argv) > 2:
+        with get_engine().connect() as conn:
+            existentes = verificar_indices(conn)
+        indexadas = {c for c, (_, valido) in existentes.items() if valido}
+        for item in avaliar_predicados(argv[2], indexadas):
+            marca = "usa índice" if item["usa_indice"] else "sem índice"
+            print(f"[{marca}] {item['predicado']}  ({item['motivo']})")
+    else:
+        print('Uso: python indices.py [verificar|criar|avaliar "<SQL>"]')
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
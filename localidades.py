@@ -0,0 +1,46 @@
+# Normalização memoizada de bairro, município e UF
+
+# localidades.py
+#
+# Uma coluna de localidade tem poucos valores distintos em relação ao número de linhas (um universo de
+# um milhão de empresas tem ~15 mil bairros): a coluna é fatorada, cada valor distinto é normalizado uma
+# vez e o resultado volta para as linhas pelos códigos inteiros. As normalizações ficam num LRU limitado,
+# do processo, compartilhado por todas as sessões.
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+CACHE_MAX = int(os.getenv("LOCALIDADES_CACHE_MAX", "200000"))  # valores distintos guardados no LRU
+TIPOS = ("bairro", "municipio", "uf")
+
+
+@lru_cache(maxsize=CACHE_MAX)
+def _normalizar(valor, tipo):
+    texto = valor.upper()
+    if tipo == "bairro":
+        # "CENTRO / SETOR 2" -> "CENTRO", como upper(trim(split_part(unaccent(bairro), '/', 1))) no banco
+        texto = texto.split("/")[0]
+    return unidecode(texto.strip())
+
+
+def normalizar(valor, tipo="bairro"):
+    """Valor de localidade sem acentos, em maiúsculas e sem espaços nas pontas; nulos ficam como estão."""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de localidade desconhecido: {tipo}")
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return valor
+    return _normalizar(str(valor), tipo)
+
+
+def normalizar_coluna(serie, tipo="bairro"):
+    """Série `serie` normalizada (ver normalizar), com uma chamada por valor distinto; nulos viram NaN."""
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de localidade desconhecido: {tipo}")
+    codigos, valores = pd.factorize(serie)
+    normalizados = np.array([_normalizar(str(v), tipo) for v in valores] + [np.nan], dtype=object)
+    # Código -1 (nulo) aponta para o NaN no fim do vetor
+    return pd.Series(normalizados[codigos], index=serie.index, name=serie.name)
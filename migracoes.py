@@ -0,0 +1,73 @@
+# Migrações pontuais do banco, rodadas à mão (nunca pelas páginas)
+
+# migracoes.py
+#
+# Uso:
+#   python migracoes.py indice-leads                        -> cria o índice único (cliente_referencia, cnpj)
+#                                                              em tb_leads_gerados; com duplicatas só as lista
+#   python migracoes.py indice-leads --remover-duplicatas   -> copia as duplicatas para uma tabela de backup,
+#                                                              remove-as (fica o menor id) e cria o índice
+#
+# Tudo roda numa única transação: se qualquer passo falhar, nada é apagado.
+
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+
+from db import TABELA_LEADS, criar_indice_unico_leads, get_engine, indice_unico_leads_existe
+
+
+def _sql_duplicatas(tabela):
+    # Registros com o mesmo (cliente_referencia, cnpj) de outro de id menor
+    return f"""
+        SELECT a.* FROM {tabela} a
+        WHERE EXISTS (
+            SELECT 1 FROM {tabela} b
+            WHERE b.cliente_referencia = a.cliente_referencia AND b.cnpj = a.cnpj AND b.id < a.id
+        )
+    """
+
+
+def indice_leads(tabela=TABELA_LEADS, remover_duplicatas=False):
+    """
+    Cria o índice único dos leads. Retorna (criado, duplicatas, tabela_backup); com duplicatas e sem
+    `remover_duplicatas` não altera nada e devolve criado=False.
+    """
+    with get_engine().begin() as conn:
+        conn.execute(text("SET LOCAL statement_timeout = 0"))
+        if indice_unico_leads_existe(conn, tabela):
+            return False, 0, None
+        duplicatas = conn.execute(text(f"SELECT COUNT(*) FROM ({_sql_duplicatas(tabela)}) d")).scalar()
+        backup = None
+        if duplicatas:
+            if not remover_duplicatas:
+                return False, duplicatas, None
+            backup = f"{tabela}_duplicatas_{datetime.now():%Y%m%d%H%M%S}"
+            conn.execute(text(f"CREATE TABLE {backup} AS {_sql_duplicatas(tabela)}"))
+            conn.execute(text(f"DELETE FROM {tabela} a USING {backup} d WHERE a.id = d.id"))
+        criar_indice_unico_leads(conn, tabela)
+        return True, duplicatas, backup
+
+
+def main(argv):
+    args = argv[1:]
+    if not args or args[0] != "indice-leads":
+        print("Uso: python migracoes.py indice-leads [--remover-duplicatas]")
+        return 1
+    criado, duplicatas, backup = indice_leads(remover_duplicatas="--remover-duplicatas" in args)
+    if not criado and not duplicatas:
+        print(f"Índice único já existe em {TABELA_LEADS}.")
+    elif not criado:
+        print(f"{duplicatas} registros duplicados (cliente_referencia, cnpj) em {TABELA_LEADS}; nada foi alterado.")
+        print("Confira-os e rode de novo com --remover-duplicatas (eles são copiados para uma tabela de backup).")
+        return 1
+    else:
+        if duplicatas:
+            print(f"{duplicatas} duplicatas copiadas para {backup} e removidas de {TABELA_LEADS}.")
+        print(f"Índice único criado em {TABELA_LEADS}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
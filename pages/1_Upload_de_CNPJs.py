@@ -3,19 +3,12 @@
 import streamlit as st
 import pandas as pd
 from io import BytesIO
-from sqlalchemy import create_engine, text
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy.types import String
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-from unidecode import unidecode
+from enriquecimento import normalizar_cnpjs, enriquecer_cnpjs
+from tipagem import compactar, resumo_memoria
 
 st.set_page_config(layout="wide", page_title="Diagnóstico e Oportunidades")
 st.title("📊 Diagnóstico e Mapa de Oportunidades")
 
-DATABASE_URL = 
-
 # Funções auxiliares
 
 def to_excel(df):
@@ -24,15 +17,12 @@ def to_excel(df):
         df.to_excel(writer, index=False)
     return output.getvalue()
 
-def buscar_dados_enriquecidos(cnpjs):
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as conn:
-        query = text("""
-            SELECT v.*
-            FROM visao_empresa_agrupada_base v
-            JOIN unnest(:cnpjs) WITH ORDINALITY AS temp(cnpj) ON v.cnpj = temp.cnpj
-        """)
-        df = pd.read_sql(query, conn, params={"cnpjs": list(cnpjs)})
+def buscar_dados_enriquecidos(cnpjs, usar_cache=True):
+    barra = st.progress(0.0, text="Buscando dados enriquecidos...")
+    def atualizar(concluidos, total):
+        barra.progress(concluidos / total, text=f"Lotes processados: {concluidos}/{total}")
+    df = enriquecer_cnpjs(cnpjs, progresso=atualizar, usar_cache=usar_cache)
+    barra.empty()
     return df
 
 # Inicialização de estados
@@ -54,6 +44,8 @@ def etapa1():
     # ✅ Se dados enriquecidos já estiverem carregados, mostra direto
     if st.session_state.get("df_cnpjs") is not None:
         st.success(f"{len(st.session_state.df_cnpjs)} registros carregados.")
+        if st.session_state.get("memoria_cnpjs"):
+            st.caption(st.session_state.memoria_cnpjs)
         st.dataframe(st.session_state.df_cnpjs)
 
         excel_data = to_excel(st.session_state.df_cnpjs)
@@ -85,14 +77,19 @@ def etapa1():
 
         # Se o df_importado está definido, mostra botão para buscar dados
         if df_importado is not None:
-            cnpjs_lista = df_importado["cnpj"].dropna().astype(str).tolist()
+            cnpjs_lista, qtd_descartados = normalizar_cnpjs(df_importado["cnpj"])
             st.success(f"{len(cnpjs_lista)} CNPJs carregados.")
+            if qtd_descartados:
+                st.info(f"{qtd_descartados} linhas descartadas por CNPJ inválido ou duplicado.")
 
+            ignorar_cache = st.checkbox("Ignorar cache local e consultar tudo no banco", value=False)
             if st.button("🔍 Buscar Dados Enriquecidos"):
-                df_enriquecido = buscar_dados_enriquecidos(cnpjs_lista)
+                df_enriquecido = buscar_dados_enriquecidos(cnpjs_lista, usar_cache=not ignorar_cache)
                 if df_enriquecido.empty:
                     st.warning("Nenhum dado encontrado.")
                 else:
+                    df_enriquecido, mb_antes, mb_depois = compactar(df_enriquecido)
+                    st.session_state.memoria_cnpjs = resumo_memoria(mb_antes, mb_depois)
                     st.session_state.df_cnpjs = df_enriquecido
                     st.session_state.cliente_carregado = True
                     st.session_state.dados_cliente = df_enriquecido
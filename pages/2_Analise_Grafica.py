@@ -1,10 +1,17 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from datetime import datetime
-import re
-from collections import Counter
 from unidecode import unidecode
+from cnae import contar_cnaes
+from palavras import contar_palavras
+from localidades import normalizar_coluna
+
+@st.cache_data(max_entries=10)
+def contagem_cnaes(df, tipo):
+    return contar_cnaes(df, tipo)
+
+@st.cache_data(max_entries=10)
+def contagem_palavras(serie, palavras_ignoradas):
+    return contar_palavras(serie, palavras_ignoradas)
 
 if "df_cnpjs" in st.session_state and "dados_cliente" not in st.session_state: # trecho adicionado para reforçar
     st.session_state.dados_cliente = st.session_state.df_cnpjs # trecho adicionado para reforçar
@@ -18,6 +25,8 @@ def etapa2():
         st.warning("Nenhum dado válido carregado. Por favor, volte para a Etapa 1 e carregue os CNPJs.")
         st.stop()
 
+    import plotly.express as px  # só quando há dados para os gráficos
+
     # Certifica-se de que as colunas necessárias para as análises existentes são numéricas/datetime
     df['capital_social'] = pd.to_numeric(df['capital_social'], errors='coerce').fillna(0)
     df['data_inicio_atividade'] = pd.to_datetime(df['data_inicio_atividade'], errors='coerce')
@@ -63,23 +72,11 @@ def etapa2():
                 "s.a", "sa", "ltda", "me", "eireli", "epp", "s.a.", "ltda.", "me.", "eireli.", "epp.",
             ])
 
-            def clean_and_tokenize(text):
-                if pd.isna(text):
-                    return []
-                text = unidecode(str(text)).lower()
-                text = re.sub(r'[^\w\s]', '', text)
-                text = re.sub(r'\d+', '', text)
-                words = [word for word in text.split() if word not in stop_words and len(word) > 1]
-                return words
+            word_counts = contagem_palavras(df['nome_fantasia'], frozenset(stop_words))
 
-            all_words = df['nome_fantasia'].apply(clean_and_tokenize).explode()
-            all_words = all_words.dropna()
-
-            if not all_words.empty:
-                word_counts = Counter(all_words)
+            if not word_counts.empty:
                 top_n = st.slider("Número de palavras para exibir:", min_value=10, max_value=50, value=20, key="top_words_slider")
-                top_words = word_counts.most_common(top_n)
-                df_top_words = pd.DataFrame(top_words, columns=['Palavra', 'Frequência'])
+                df_top_words = word_counts.head(top_n).rename(columns={'palavra': 'Palavra', 'frequencia': 'Frequência'})
 
                 fig_words = px.bar(
                     df_top_words,
@@ -148,11 +145,8 @@ def etapa2():
         # Análise por Bairro
         with loc_tabs[2]:
             if 'bairro' in df.columns and not df['bairro'].empty:
-                def normalizar_bairro(bairro):
-                    return unidecode(str(bairro).upper().split('/')[0].strip())
-
                 df_temp = df.copy()
-                df_temp['bairro_normalizado'] = df_temp['bairro'].apply(normalizar_bairro)
+                df_temp['bairro_normalizado'] = normalizar_coluna(df_temp['bairro'], 'bairro')
                 
                 bairro_counts = df_temp['bairro_normalizado'].value_counts()
                 
@@ -189,57 +183,20 @@ def etapa2():
             key="cnae_type_radio"
         )
 
-        all_cnaes_info = [] # Armazenará tuplas (código, descrição)
-
-        # REMOVIDA: A função parse_cnae_string não é mais necessária
+        tipo_cnae = {'CNAE Principal': 'principal', 'CNAEs Secundários': 'secundario', 'Ambos': 'ambos'}[cnae_type]
+        if tipo_cnae in ('principal', 'ambos') and not {'cod_cnae_principal', 'cnae_principal'} <= set(df.columns):
+            st.info("Colunas 'cod_cnae_principal' ou 'cnae_principal' não encontradas ou estão vazias.")
+        if tipo_cnae in ('secundario', 'ambos') and not {'cod_cnae_secundario', 'cnae_secundario'} <= set(df.columns):
+            st.info("Colunas 'cod_cnae_secundario' ou 'cnae_secundario' não encontradas ou estão vazias.")
 
-        # Processa CNAE Principal
-        if cnae_type == 'CNAE Principal' or cnae_type == 'Ambos':
-            # AGORA USAMOS 'cod_cnae_principal' E 'cnae_principal'
-            if 'cod_cnae_principal' in df.columns and 'cnae_principal' in df.columns and \
-               not df['cod_cnae_principal'].empty and not df['cnae_principal'].empty:
-                
-                temp_df = df[['cod_cnae_principal', 'cnae_principal']].dropna().astype(str)
-                for _, row in temp_df.iterrows():
-                    code = row['cod_cnae_principal'].strip()
-                    description = row['cnae_principal'].strip()
-                    if code and description: 
-                        all_cnaes_info.append((code, description))
-            else:
-                st.info("Colunas 'cod_cnae_principal' ou 'cnae_principal' não encontradas ou estão vazias.")
+        # Pares (código, descrição) contados de forma vetorizada e em cache: mexer no slider não reconta
+        cnae_pair_counts = contagem_cnaes(df, tipo_cnae)
 
-        # Processa CNAEs Secundários
-        if cnae_type == 'CNAEs Secundários' or cnae_type == 'Ambos':
-            # AGORA USAMOS 'cod_cnae_secundario' E 'cnae_secundario'
-            if 'cod_cnae_secundario' in df.columns and 'cnae_secundario' in df.columns and \
-               not df['cod_cnae_secundario'].empty and not df['cnae_secundario'].empty:
-                
-                temp_df = df[['cod_cnae_secundario', 'cnae_secundario']].dropna().astype(str)
-                for _, row in temp_df.iterrows():
-                    # Supondo que tanto o código quanto a descrição podem vir múltiplos, separados por '; '
-                    # e que a ordem se mantém entre eles.
-                    codes = row['cod_cnae_secundario'].split('; ') 
-                    descriptions = row['cnae_secundario'].split('; ') 
-
-                    for i in range(min(len(codes), len(descriptions))):
-                        code = codes[i].strip()
-                        description = descriptions[i].strip()
-                        if code and description:
-                            all_cnaes_info.append((code, description))
-            else:
-                st.info("Colunas 'cod_cnae_secundario' ou 'cnae_secundario' não encontradas ou estão vazias.")
-        
-        if all_cnaes_info:
-            cnae_pair_counts = Counter(all_cnaes_info)
-            
+        if not cnae_pair_counts.empty:
             top_n_cnae = st.slider("Número de CNAEs para exibir:", min_value=10, max_value=50, value=20, key="top_cnaes_slider_horizontal")
-            top_cnaes_pairs_freq = cnae_pair_counts.most_common(top_n_cnae)
-
-            df_top_cnaes_data = []
-            for (code, description), frequency in top_cnaes_pairs_freq:
-                df_top_cnaes_data.append({'CNAE Código': code, 'CNAE Descrição': description, 'Frequência': frequency})
-            
-            df_top_cnaes = pd.DataFrame(df_top_cnaes_data)
+            df_top_cnaes = cnae_pair_counts.head(top_n_cnae).rename(
+                columns={'codigo': 'CNAE Código', 'descricao': 'CNAE Descrição', 'frequencia': 'Frequência'}
+            )
 
             # Ordenar por frequência para o gráfico e a tabela
             df_top_cnaes = df_top_cnaes.sort_values('Frequência', ascending=False)
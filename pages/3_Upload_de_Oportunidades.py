@@ -4,19 +4,15 @@
 import streamlit as st
 import pandas as pd
 from io import BytesIO
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.types import String
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-from unidecode import unidecode
+from db import conexao
+from tipagem import compactar, resumo_memoria
 
 st.set_page_config(layout="wide", page_title="Diagnóstico e Oportunidades")
 st.title("📊 Diagnóstico e Mapa de Oportunidades")
 
-DATABASE_URL = 
-
 # Funções auxiliares
 
 def to_excel(df):
@@ -26,8 +22,7 @@ def to_excel(df):
     return output.getvalue()
 
 def buscar_dados_enriquecidos(cnpjs):
-    engine = create_engine(DATABASE_URL)
-    with engine.connect() as conn:
+    with conexao("upload_oportunidades") as conn:
         query = text("""
             SELECT *
             FROM visao_empresa_completa
@@ -67,8 +62,10 @@ else:
     oportunidades_file = st.file_uploader("Upload do universo total de oportunidades", type=["csv", "xlsx"], key="upload_oportunidades")
     if oportunidades_file:
         df = pd.read_csv(oportunidades_file, dtype=str) if oportunidades_file.name.endswith(".csv") else pd.read_excel(oportunidades_file, dtype=str)
+        df, mb_antes, mb_depois = compactar(df)
         st.session_state.df_oportunidades = df
         st.success("Base de oportunidades carregada.")
+        st.caption(resumo_memoria(mb_antes, mb_depois))
         st.dataframe(df.head())
 
     coords_file = st.file_uploader("Upload do arquivo com coordenadas (por CEP ou por Bairro)", type=["csv", "xlsx"], key="upload_coords")
@@ -94,10 +91,12 @@ else:
             st.error("O arquivo de coordenadas deve conter colunas para CEP ou para Bairro com latitude e longitude.")
             st.stop()
 
+        df, mb_antes, mb_depois = compactar(df)
         st.session_state.df_coords = df
         st.session_state.df_coords_tipo = tipo_coord  # salvar o tipo de coordenada
 
         st.success(f"Base de coordenadas por {tipo_coord.upper()} carregada.")
+        st.caption(resumo_memoria(mb_antes, mb_depois))
         st.dataframe(df.head())
 
     if st.session_state.df_oportunidades is not None and st.session_state.df_coords is not None:
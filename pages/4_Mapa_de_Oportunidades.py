@@ -2,7 +2,7 @@
 import streamlit as st
 import pandas as pd
 from io import BytesIO
-import plotly.express as px
+from chaves_cnpj import conjunto, contem, para_chaves
 
 
 st.set_page_config(layout="wide", page_title="Diagnóstico e Oportunidades")
@@ -25,13 +25,14 @@ if df_universo is None or df_coords is None or tipo_coords is None:
     st.warning("⚠️ Carregue os dados na etapa 3 antes de acessar o mapa.")
     st.stop()
 
-# Preparação
-df_universo['cnpj'] = df_universo['cnpj'].astype(str).str.zfill(14)
+# Preparação: universo menos clientes com chaves int64 (chaves_cnpj.py); o texto de 14 dígitos
+# só é montado para as oportunidades que sobram
 if df_cliente is not None:
-    df_cliente['cnpj'] = df_cliente['cnpj'].astype(str).str.zfill(14)
-    df_oportunidades = df_universo[~df_universo['cnpj'].isin(df_cliente['cnpj'])].copy()
+    atendidos = contem(conjunto(df_cliente['cnpj']), para_chaves(df_universo['cnpj']))
+    df_oportunidades = df_universo[~atendidos].copy()
 else:
     df_oportunidades = df_universo.copy()
+df_oportunidades['cnpj'] = df_oportunidades['cnpj'].astype(str).str.zfill(14)
 
 if df_oportunidades.empty:
     st.warning("Todas as oportunidades já estão atendidas.")
@@ -56,13 +57,12 @@ if tipo_coords == "cep":
     hover = 'cep'
 
 elif tipo_coords == "bairro":
-    from unidecode import unidecode
-    def normalizar_bairro(bairro):
-        return unidecode(str(bairro).upper().split('/')[0].strip())
+    from localidades import normalizar_coluna
 
+    # Mesma normalização dos dois lados do merge, uma vez por valor distinto
     for col in ['uf', 'municipio', 'bairro']:
-        df_oportunidades[col] = df_oportunidades[col].str.upper().str.strip()
-        df_coords[col] = df_coords[col].str.upper().str.strip()
+        df_oportunidades[col] = normalizar_coluna(df_oportunidades[col], col)
+        df_coords[col] = normalizar_coluna(df_coords[col], col)
 
     df_oportunidades['capital_social'] = pd.to_numeric(df_oportunidades['capital_social'], errors='coerce').fillna(0)
 
@@ -96,6 +96,8 @@ visualizacao = st.radio(
     ["Quantidade de Empresas", "Capital Social"]
 )
 
+import plotly.express as px  # só depois das verificações acima: sem dados a página não chega aqui
+
 # Configuração do mapa dependendo da escolha
 if visualizacao == "Quantidade de Empresas":
     fig = px.scatter_mapbox(
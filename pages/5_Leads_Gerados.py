@@ -1,17 +1,24 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import text, inspect
 from io import BytesIO
 import re
-from collections import Counter
 from unidecode import unidecode
 from datetime import datetime, timedelta
+from db import get_engine, conexao, salvar_leads_em_massa, criar_indice_unico_leads, indice_unico_leads_existe
+from diagnostico import modo_diagnostico_ativo, explicar_consulta, registrar_plano, painel_plano
+from tarefas import iniciar_tarefa, acompanhar_tarefa, CONCLUIDA, CANCELADA
+from estimativa import estimar_resultado, confirmar_execucao
+from filtros import espec_de_parametros_ia, compilar
+from cache_resultados import chave_sql
+from coalescencia import executar_uma_vez
+from cnae import top_cnaes
+from palavras import top_palavras
+from chaves_cnpj import conjunto
 
 st.set_page_config(layout="wide", page_title="IA Re-Gerador de Leads")
 st.title("🔄 IA Re-Gerador: Reavalie e Gere Novos Leads")
 
-DATABASE_URL = ""
-
 # --- Inicialização de estados da sessão para o Re-Gerador (independentes) ---
 if 're_gen_current_score' not in st.session_state:
     st.session_state.re_gen_current_score = 0
@@ -110,19 +117,8 @@ def get_unique_values(df, column, top_n=None, include_null=False, include_empty=
 def get_top_n_words(df, column, top_n, stop_words, include_null=False, include_empty=False):
     if column not in df.columns:
         return []
-    all_words = []
-    def clean_and_tokenize(text):
-        if pd.isna(text) or str(text).strip() == "":
-            return []
-        text = unidecode(str(text).strip().lower())
-        text = re.sub(r'[^\w\s]', '', text)
-        text = re.sub(r'\d+', '', text)
-        words = [word for word in text.split() if word not in stop_words and len(word) > 1]
-        return words
-    temp_series_non_null_empty = df[column][df[column].notna() & (df[column].astype(str).str.strip() != "")].apply(clean_and_tokenize).explode()
-    all_words.extend(temp_series_non_null_empty.dropna().tolist())
-    word_counts = Counter(all_words)
-    common_words = [word for word, count in word_counts.most_common(top_n)]
+    # Cada valor distinto é tokenizado uma vez (palavras.py)
+    common_words = top_palavras(df[column], top_n, stop_words)
     if include_null and df[column].isna().any():
         if "(Nulo)" not in common_words:
             common_words.append("(Nulo)")
@@ -133,29 +129,8 @@ def get_top_n_words(df, column, top_n, stop_words, include_null=False, include_e
 
 @st.cache_data
 def get_top_n_cnaes(df, cnae_type, top_n, include_null=False, include_empty=False):
-    all_cnaes_info = []
-    def add_cnaes_from_columns(codes_col, descriptions_col):
-        if codes_col in df.columns and descriptions_col in df.columns:
-            valid_cnae_rows = df[df[codes_col].notna() & (df[codes_col].astype(str).str.strip() != "")]
-            for _, row in valid_cnae_rows.iterrows():
-                codes_str = str(row[codes_col]).strip()
-                descriptions_str = str(row[descriptions_col]).strip()
-                codes = [c.strip() for c in codes_str.split('; ') if c.strip()]
-                descriptions = [d.strip() for d in descriptions_str.split('; ') if d.strip()]
-                for i in range(min(len(codes), len(descriptions))):
-                    code = codes[i]
-                    description = descriptions[i]
-                    if code and description:
-                        all_cnaes_info.append((code, description))
-    if cnae_type == 'principal' or cnae_type == 'ambos':
-        add_cnaes_from_columns('cod_cnae_principal', 'cnae_principal')
-    if cnae_type == 'secundario' or cnae_type == 'ambos':
-        add_cnaes_from_columns('cod_cnae_secundario', 'cnae_secundario')
-    if not all_cnaes_info:
-        common_cnaes = []
-    else:
-        cnae_pair_counts = Counter(all_cnaes_info)
-        common_cnaes = [(code, desc) for (code, desc), freq in cnae_pair_counts.most_common(top_n)]
+    # Pares (código, descrição) contados de forma vetorizada (cnae.py)
+    common_cnaes = top_cnaes(df, cnae_type, top_n)
     if cnae_type == 'principal' or cnae_type == 'ambos':
         # Check against the original column names for null/empty checks
         if include_null and df['cod_cnae_principal'].isna().any():
@@ -176,208 +151,23 @@ def get_top_n_cnaes(df, cnae_type, top_n, include_null=False, include_empty=Fals
 
 # --- FUNÇÃO PRINCIPAL DE GERAÇÃO DA QUERY SQL (reutilizada e adaptada) ---
 def generate_sql_query(params, excluded_cnpjs_set=None, limit=1000):
-    base_query = "SELECT vea.*"
-    joins = []
-    query_params = {}
-    param_counter = 0
-    conditions = []
-    conditions.append("vea.situacao_cadastral = 'ATIVA'")
-    uf_param = params.get("uf", [])
-    municipio_param = params.get("municipio", [])
-    
-    if uf_param:
-        uf_cond_list = []
-        for i, uf in enumerate(uf_param):
-            param_name = f"uf_fixed_{i}"
-            uf_cond_list.append(f"vea.uf = :{param_name}")
-            query_params[param_name] = uf
-        conditions.append(f"({' OR '.join(uf_cond_list)})")
-    
-    if municipio_param:
-        municipio_cond_list = []
-        for i, mun in enumerate(municipio_param):
-            param_name = f"mun_fixed_{i}"
-            municipio_cond_list.append(f"vea.municipio = :{param_name}")
-            query_params[param_name] = mun
-        conditions.append(f"({' OR '.join(municipio_cond_list)})")
- 
-    col_map = {
-        'nome_fantasia': 'vea.nome_fantasia',
-        'uf': 'vea.uf',
-        'municipio': 'vea.municipio',
-        'bairro': 'vea.bairro',
-        'cod_cnae_principal': 'vea.cod_cnae_principal',
-        'cod_cnae_secundario': 'vea.cod_cnae_secundario',
-        'data_inicio_atividade': 'vea.data_inicio_atividade',
-        'capital_social': 'vea.capital_social',
-        'porte_empresa': 'vea.porte_empresa',
-        'natureza_juridica': 'vea.natureza_juridica',
-        'opcao_simples': 'vea.opcao_simples',
-        'opcao_mei': 'vea.opcao_mei',
-        'situacao_cadastral': 'vea.situacao_cadastral',
-        'ddd1': 'vea.ddd1',
-        'nomes_socios': 'vea.nomes_socios',
-        'qualificacoes': 'vea.qualificacoes',
-        'faixas_etarias': 'vea.faixas_etarias'
-    }
+    # Filtros compilados por filtros.py (mesma semântica do IA Generator e da Consulta Avançada)
+    espec = espec_de_parametros_ia(
+        params, excluir_cnpjs=() if excluded_cnpjs_set is None else excluded_cnpjs_set, limite=limit, gerador="regerador"
+    )
+    sql, query_params = compilar(espec, 'leads', alias='vea')
+    return text(sql), query_params
 
-    for param, value in params.items():
-        if value is None or (isinstance(value, list) and not value) or (isinstance(value, tuple) and not all(value)):
-            continue
-            
-        if param != 'situacao_cadastral': 
-            col_name = col_map.get(param)
-            param_conditions = []
-            
-            if param in ['uf', 'municipio', 'bairro', 'natureza_juridica',
-                            'qualificacoes', 'faixas_etarias', 'ddd1',
-                            'porte_empresa', 'opcao_simples', 'opcao_mei']:
-
-                actual_values = [v for v in value if v != "(Nulo)" and v != "(Vazio)"]
-                include_null_condition = "(Nulo)" in value
-                include_empty_condition = "(Vazio)" in value
-
-                if actual_values:
-                    param_name_base = f"{param}_list_{param_counter}"
-                    placeholders_cond = []
-                    for i, val in enumerate(actual_values):
-                        ph_name = f"{param_name_base}_{i}"
-                        placeholders_cond.append(f"unaccent(upper({col_name})) = unaccent(upper(trim(TRAILING ' ' FROM :{ph_name})))")
-                        query_params[ph_name] = val.replace("'", "''")
-                    param_counter += 1
-                    param_conditions.append(f"({' OR '.join(placeholders_cond)})")
-                
-                if include_null_condition:
-                    param_conditions.append(f"{col_name} IS NULL")
-                if include_empty_condition:
-                    param_conditions.append(f"{col_name} = ''")
-
-                if param_conditions:
-                    conditions.append(f"({' OR '.join(param_conditions)})")
-
-            elif param == 'nome_fantasia':
-                actual_words = [w for w in value if w != "(Nulo)" and w != "(Vazio)"]
-                include_null_condition = "(Nulo)" in value
-                include_empty_condition = "(Vazio)" in value
-
-                word_search_conditions = []
-                for word in actual_words:
-                    param_name = f"nf_k_{param_counter}"
-                    word_search_conditions.append(f"unaccent(upper({col_name})) ILIKE unaccent(upper(trim(TRAILING ' ' FROM :{param_name})))")
-                    query_params[param_name] = f'%{word.replace("'", "''")}%'
-                    param_counter += 1
-                
-                if include_null_condition:
-                    word_search_conditions.append(f"{col_name} IS NULL")
-                if include_empty_condition:
-                    word_search_conditions.append(f"{col_name} = ''")
-                
-                if word_search_conditions:
-                    conditions.append(f"({' OR '.join(word_search_conditions)})")
-
-            elif param == 'cod_cnae_principal':
-                codes_list = [code for code, _ in value if code != "(Nulo)" and code != "(Vazio)"]
-                include_null_cnae_p = any(code == "(Nulo)" for code, _ in value)
-                include_empty_cnae_p = any(code == "(Vazio)" for code, _ in value)
-                
-                main_cnae_conditions = []
-                cnae_principal_col_alias = col_map.get('cod_cnae_principal') 
-                for code in codes_list:
-                    param_name = f"cnae_pr_code_{code.replace('.', '_')}_{param_counter}"
-                    main_cnae_conditions.append(f"{cnae_principal_col_alias} = :{param_name}")
-                    query_params[param_name] = code.replace("'", "''")
-                    param_counter += 1
-                
-                if include_null_cnae_p:
-                    main_cnae_conditions.append(f"vea.cnae_principal IS NULL") 
-                if include_empty_cnae_p:
-                    main_cnae_conditions.append(f"vea.cnae_principal = ''") 
-
-                if main_cnae_conditions:
-                    conditions.append(f"({' OR '.join(main_cnae_conditions)})")
-
-            elif param == 'cod_cnae_secundario':
-                codes_list = [code for code, _ in value if code != "(Nulo)" and code != "(Vazio)"]
-                include_null_cnae_s = any(code == "(Nulo)" for code, _ in value)
-                include_empty_cnae_s = any(code == "(Vazio)" for code, _ in value)
-
-                secondary_cnae_like_conditions = []
-                cnae_sec_col_alias = col_map.get('cod_cnae_secundario') 
-                for code in codes_list:
-                    param_name = f"cnae_sec_code_{code.replace('.', '_')}_{param_counter}"
-                    secondary_cnae_like_conditions.append(f"{cnae_sec_col_alias} ILIKE :{param_name}")
-                    query_params[param_name] = f'%{code.replace("'", "''")}%'
-                    param_counter += 1
-                
-                if include_null_cnae_s:
-                    secondary_cnae_like_conditions.append(f"vea.cnae_secundario IS NULL") 
-                if include_empty_cnae_s:
-                    secondary_cnae_like_conditions.append(f"vea.cnae_secundario = ''") 
-
-                if secondary_cnae_like_conditions:
-                    conditions.append(f"({' OR '.join(secondary_cnae_like_conditions)})")
-            
-            elif param == 'data_inicio_atividade':
-                col_name = col_map.get(param)
-                start_date, end_date = value
-                param_name_start = f"start_date_{param_counter}"
-                param_name_end = f"end_date_{param_counter}"
-                conditions.append(f"{col_name} BETWEEN :{param_name_start} AND :{param_name_end}")
-                query_params[param_name_start] = start_date
-                query_params[param_name_end] = end_date
-                param_counter += 1
-
-            elif param == 'capital_social':
-                col_name = col_map.get(param)
-                min_val, max_val = value
-                param_name_min = f"min_capital_{param_counter}"
-                param_name_max = f"max_capital_{param_counter}"
-                conditions.append(f"{col_name} >= :{param_name_min} AND {col_name} <= :{param_name_max}")
-                query_params[param_name_min] = min_val
-                query_params[param_name_max] = max_val
-                param_counter += 1
-            
-            elif param == 'nomes_socios':
-                col_name = col_map.get(param)
-                actual_name_parts = [p for p in value if p != "(Nulo)" and p != "(Vazio)"]
-                include_null_condition = "(Nulo)" in value
-                include_empty_condition = "(Vazio)" in value
-
-                sub_conditions = []
-                for name_part in actual_name_parts:
-                    param_name = f"socio_name_{param_counter}"
-                    sub_conditions.append(f"unaccent(upper({col_name})) ILIKE unaccent(upper(trim(TRAILING ' ' FROM :{param_name})))")
-                    query_params[param_name] = f'%{name_part.replace("'", "''")}%'
-                    param_counter += 1
-                
-                if include_null_condition:
-                    sub_conditions.append(f"{col_name} IS NULL")
-                if include_empty_condition:
-                    sub_conditions.append(f"{col_name} = ''")
-                
-                if sub_conditions:
-                    conditions.append(f"({' OR '.join(sub_conditions)})")
-
-    if excluded_cnpjs_set:
-        # Ensure excluded_cnpjs_set contains string values for comparison
-        excluded_cnpjs_str = [str(c) for c in list(excluded_cnpjs_set)]
-        if excluded_cnpjs_str: # Only add if there are actual CNPJs to exclude
-            param_name_excluded_cnpjs = f"excluded_cnpjs_{param_counter}"
-            # Create a list of individual parameter placeholders for IN clause
-            placeholders = [f":{param_name_excluded_cnpjs}_{i}" for i in range(len(excluded_cnpjs_str))]
-            conditions.append(f"vea.cnpj NOT IN ({', '.join(placeholders)})")
-            for i, c in enumerate(excluded_cnpjs_str):
-                query_params[f"{param_name_excluded_cnpjs}_{i}"] = c
-            param_counter += 1
-
-    final_query_sql = f"""
-        {base_query} 
-        FROM visao_empresa_agrupada_base vea 
-        WHERE {' AND '.join(conditions)}
-        LIMIT {limit}
-    """
-
-    return text(final_query_sql), query_params
+def buscar_novos_leads(conn, sql_query, query_params, diagnostico=False):
+    # Roda em segundo plano (tarefas.iniciar_tarefa): nada de st.* aqui
+    # A mesma busca já em andamento em outra sessão é aguardada, não repetida
+    chave = (chave_sql(sql_query, query_params), diagnostico)
+    return executar_uma_vez(chave, _buscar_novos_leads, conn, sql_query, query_params, diagnostico)
+
+def _buscar_novos_leads(conn, sql_query, query_params, diagnostico):
+    df_new_leads = pd.read_sql(sql_query, conn, params=query_params)
+    plano = explicar_consulta(conn, sql_query, query_params) if diagnostico else None
+    return df_new_leads, plano
 
 def calculate_score(params):
     score = 0
@@ -388,11 +178,12 @@ def calculate_score(params):
 
 def ensure_leads_table_exists(df_to_save, table_name='tb_leads_gerados', engine=None):
     if engine is None:
-        engine = create_engine(DATABASE_URL)
+        engine = get_engine()
     
     inspector = inspect(engine)
+    tabela_nova = not inspector.has_table(table_name)
     
-    if not inspector.has_table(table_name):
+    if tabela_nova:
         st.info(f"Tabela '{table_name}' não encontrada. Criando a tabela...")
         try:
             df_temp = df_to_save.copy()
@@ -501,20 +292,31 @@ def ensure_leads_table_exists(df_to_save, table_name='tb_leads_gerados', engine=
                             st.info(f"Coluna 'id' já existe e já é PRIMARY KEY na tabela '{table_name}'.")
                         else:
                             st.warning(f"Não foi possível garantir que 'id' é PRIMARY KEY (pode já ser ou outro erro): {pk_e}")
-            
+
             trans.commit()
         except Exception as e:
             trans.rollback()
             st.error(f"Erro ao configurar SERIAL PRIMARY KEY ou PK em 'id' na tabela {table_name}: {e}")
             raise
 
+    # Índice único do ON CONFLICT, fora do bloco da chave primária: sem ele o erro é a instrução da migração
+    with engine.begin() as conn:
+        if tabela_nova:
+            # Tabela recém-criada e vazia: o índice nasce junto com ela
+            criar_indice_unico_leads(conn, table_name)
+            st.success(f"Índice único (cliente_referencia, cnpj) criado na tabela '{table_name}'.")
+        elif not indice_unico_leads_existe(conn, table_name):
+            raise RuntimeError(
+                f"A tabela '{table_name}' não tem o índice único (cliente_referencia, cnpj). "
+                "Rode `python migracoes.py indice-leads` antes de salvar leads."
+            )
+
 
 # --- Função para buscar clientes distintos ---
 @st.cache_data(ttl=3600) # Cache por 1 hora
 def get_distinct_client_references():
-    engine = create_engine(DATABASE_URL)
     try:
-        with engine.connect() as conn:
+        with conexao("leads_gerados") as conn:
             query = text("SELECT DISTINCT cliente_referencia FROM tb_leads_gerados ORDER BY cliente_referencia;")
             df_clients = pd.read_sql(query, conn)
             return df_clients['cliente_referencia'].dropna().tolist()
@@ -527,9 +329,8 @@ def get_distinct_client_references():
 def load_leads_by_client_reference(client_refs):
     if not client_refs:
         return pd.DataFrame()
-    engine = create_engine(DATABASE_URL)
     try:
-        with engine.connect() as conn:
+        with conexao("leads_gerados") as conn:
             # Using text for parameterized query to handle list of client_refs
             placeholders = ', '.join([f":client_{i}" for i in range(len(client_refs))])
             query = f"SELECT * FROM tb_leads_gerados WHERE cliente_referencia IN ({placeholders})"
@@ -583,7 +384,7 @@ else:
             # Get CNPJs already present for the selected client references
             # These CNPJs will be excluded from the new search IF saving for the SAME client_referencia.
             # For now, let's just get all of them. The exclusion logic will be in the save step.
-            existing_cnpjs_for_selected_clients = set(df_analysis_source['cnpj'].dropna().astype(str).tolist()) if 'cnpj' in df_analysis_source.columns else set()
+            existing_cnpjs_for_selected_clients = conjunto(df_analysis_source['cnpj'] if 'cnpj' in df_analysis_source.columns else [])
             st.session_state.re_gen_existing_cnpjs = existing_cnpjs_for_selected_clients
 
             # --- Critérios de Identificação de Perfil ---
@@ -1160,7 +961,9 @@ else:
             
             st.markdown("---")
             st.markdown("## 3️⃣ Geração e Análise de Novos Leads")
+            modo_diagnostico = modo_diagnostico_ativo()
 
+            estimativa = None
             if st.button("🚀 Gerar Novos Leads", key="re_gen_generate_leads_button", type="primary"):
                 if not re_gen_ia_params:
                     st.warning("Selecione pelo menos um critério para gerar novos leads.")
@@ -1171,35 +974,54 @@ else:
                     try:
                         sql_query, query_params = generate_sql_query(re_gen_ia_params, excluded_cnpjs_set=st.session_state.re_gen_existing_cnpjs, limit=lead_limit)
                         st.session_state.re_gen_current_sql_query = str(sql_query) # Store for display, CORREÇÃO AQUI
-                        
-                        engine = create_engine(DATABASE_URL)
-                        with engine.connect() as conn:
-                            st.write("Executando consulta SQL...")
-                            st.code(str(sql_query), language="sql") # Display the generated SQL, CORREÇÃO AQUI
-                            
-                            df_new_leads = pd.read_sql(sql_query, conn, params=query_params)
-                            st.session_state.re_gen_df_new_leads_found = df_new_leads
-
-                            if not df_new_leads.empty:
-                                st.success(f"Encontrados {len(df_new_leads)} novos leads.")
-                                st.dataframe(df_new_leads, use_container_width=True)
-
-                                # Adicionar botão de download
-                                st.download_button(
-                                    label="📥 Baixar Novos Leads (Excel)",
-                                    data=to_excel(df_new_leads),
-                                    file_name=f"novos_leads_gerados_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
-                                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                                    key="re_gen_download_button"
-                                )
-
-                            else:
-                                st.warning("Nenhum novo lead encontrado com os critérios especificados.")
+                        st.session_state.re_gen_current_query_params = query_params
 
+                        st.session_state.pop("re_gen_preflight", None)
+                        estimativa = estimar_resultado(sql_query, query_params, pagina="leads_gerados")
                     except Exception as e:
                         st.error(f"Erro ao gerar ou executar a consulta SQL: {e}")
                         st.write("Detalhes do erro:")
                         st.exception(e)
+
+            if confirmar_execucao("re_gen_preflight", estimativa):
+                iniciar_tarefa(
+                    "re_gen_tarefa_leads", "leads_gerados", buscar_novos_leads,
+                    text(st.session_state.re_gen_current_sql_query), st.session_state.re_gen_current_query_params,
+                    diagnostico=modo_diagnostico, rotulo="Executando consulta SQL",
+                )
+
+            # Última consulta compilada: continua visível enquanto roda, depois de concluída, cancelada ou com erro
+            if st.session_state.re_gen_current_sql_query:
+                st.code(st.session_state.re_gen_current_sql_query, language="sql") # Display the generated SQL, CORREÇÃO AQUI
+
+            tarefa_leads = acompanhar_tarefa("re_gen_tarefa_leads")
+            if tarefa_leads is not None:
+                if tarefa_leads.status == CONCLUIDA:
+                    df_new_leads, plano = tarefa_leads.resultado
+                    st.session_state.re_gen_df_new_leads_found = df_new_leads
+
+                    if not df_new_leads.empty:
+                        st.success(f"Encontrados {len(df_new_leads)} novos leads.")
+                        st.dataframe(df_new_leads, use_container_width=True)
+
+                        # Adicionar botão de download
+                        st.download_button(
+                            label="📥 Baixar Novos Leads (Excel)",
+                            data=to_excel(df_new_leads),
+                            file_name=f"novos_leads_gerados_{datetime.now().strftime('%Y%m%d_%H%M')}.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            key="re_gen_download_button"
+                        )
+
+                    else:
+                        st.warning("Nenhum novo lead encontrado com os critérios especificados.")
+
+                    if plano is not None:
+                        painel_plano(registrar_plano(plano, "leads_gerados"))
+                elif tarefa_leads.status == CANCELADA:
+                    st.warning("Geração de novos leads cancelada.")
+                else:
+                    st.error(f"Erro ao gerar ou executar a consulta SQL: {tarefa_leads.erro}")
     else:
         st.info("Por favor, selecione um 'Cliente de Referência' para começar a análise.")
 
@@ -1224,29 +1046,28 @@ if st.button("💾 Salvar Novos Leads no Banco de Dados"):
             df_leads_to_save['data_geracao'] = datetime.now().date()
             df_leads_to_save['pontuacao'] = st.session_state.get("re_gen_current_score", 0)
 
-            engine = create_engine(DATABASE_URL)
+            engine = get_engine()
             ensure_leads_table_exists(df_leads_to_save, engine=engine)
 
-            with engine.begin() as conn:
-                existing_query = text("SELECT cnpj FROM tb_leads_gerados WHERE cliente_referencia = :ref")
-                existing_cnpjs = pd.read_sql(existing_query, conn, params={"ref": save_client_ref})
-                existing_cnpjs_set = set(existing_cnpjs['cnpj'].astype(str))
-                df_to_insert = df_leads_to_save[~df_leads_to_save['cnpj'].astype(str).isin(existing_cnpjs_set)]
+            colunas_existentes = [
+                'cnpj', 'razao_social', 'nome_fantasia', 'cod_cnae_principal', 'cnae_principal',
+                'cod_cnae_secundario', 'cnae_secundario', 'logradouro', 'numero', 'complemento',
+                'bairro', 'municipio', 'uf', 'cep', 'ddd1', 'telefone1', 'email',
+                'data_inicio_atividade', 'capital_social', 'porte_empresa', 'natureza_juridica',
+                'opcao_simples', 'opcao_mei', 'situacao_cadastral', 'nomes_socios',
+                'qualificacoes', 'faixas_etarias', 'cliente_referencia', 'data_geracao', 'pontuacao'
+            ]
+            df_to_insert = df_leads_to_save[[col for col in df_leads_to_save.columns if col in colunas_existentes]]
 
-                if df_to_insert.empty:
-                    st.info("Todos os leads já estavam cadastrados para este cliente.")
-                else:
-                    colunas_existentes = [
-                        'cnpj', 'razao_social', 'nome_fantasia', 'cod_cnae_principal', 'cnae_principal',
-                        'cod_cnae_secundario', 'cnae_secundario', 'logradouro', 'numero', 'complemento',
-                        'bairro', 'municipio', 'uf', 'cep', 'ddd1', 'telefone1', 'email',
-                        'data_inicio_atividade', 'capital_social', 'porte_empresa', 'natureza_juridica',
-                        'opcao_simples', 'opcao_mei', 'situacao_cadastral', 'nomes_socios',
-                        'qualificacoes', 'faixas_etarias', 'cliente_referencia', 'data_geracao', 'pontuacao'
-                    ]
-                    df_to_insert = df_to_insert[[col for col in df_to_insert.columns if col in colunas_existentes]]
+            # CNPJs já cadastrados para o cliente são ignorados pelo índice único (ON CONFLICT DO NOTHING)
+            with conexao("leads_gerados") as conn:
+                qtd_salvos, qtd_ignorados = salvar_leads_em_massa(conn, df_to_insert, 'tb_leads_gerados')
 
-                    df_to_insert.to_sql('tb_leads_gerados', con=conn, if_exists='append', index=False)
-                    st.success(f"{len(df_to_insert)} novos leads salvos com sucesso para '{save_client_ref}'.")
+            if qtd_salvos == 0:
+                st.info("Todos os leads já estavam cadastrados para este cliente.")
+            else:
+                st.success(f"{qtd_salvos} novos leads salvos com sucesso para '{save_client_ref}'.")
+                if qtd_ignorados:
+                    st.info(f"{qtd_ignorados} leads já estavam cadastrados para este cliente e foram ignorados.")
     except Exception as e:
         st.error(f"Erro ao salvar leads: {e}")
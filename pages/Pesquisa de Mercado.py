@@ -1,25 +1,34 @@
 import streamlit as st
 import pandas as pd
-from sqlalchemy import create_engine, text
-from unidecode import unidecode
+from sqlalchemy import text
 import datetime
-import plotly.express as px
-import re
 from collections import Counter
+from db import get_engine, conexao, ler_sql_em_blocos, ler_sql_na_conexao
+from indices import verificar_indices, avaliar_predicados
+from diagnostico import modo_diagnostico_ativo, explicar_consulta, registrar_plano, painel_plano
+from tarefas import iniciar_tarefa, acompanhar_tarefa, CONCLUIDA, CANCELADA
+from estimativa import estimar_resultado, confirmar_execucao
+from filtros import PARAMETROS_CONSULTA, condicao, especificar, compilar, compilar_where, impressao_digital
+from cache_resultados import TTL_SEM_VERSAO_HORAS, chave_resultado, chave_sql, ler_resultado, gravar_resultado
+from enriquecimento import versao_base
+from coalescencia import executar_uma_vez
+from palavras import contar_palavras
+from localidades import normalizar_coluna
+from tipagem import compactar, resumo_memoria
 
 # --- Configuração inicial ---
 st.set_page_config(layout="wide", page_title="Consulta Avançada de CNPJs + Pesquisa de Mercado")
 st.title("🔍 Consulta Avançada de Empresas com Filtros SQL")
 
 # --- Conexão com banco de dados ---
-DATABASE_URL = 
 TABELA = "visao_empresa_agrupada_base"
+TAMANHO_PAGINA = 500
 
 
-def get_database_engine_for_app(db_url):
+def get_database_engine_for_app():
     try:
-        engine_ = create_engine(db_url)
-        with engine_.connect() as conn:
+        engine_ = get_engine()
+        with conexao("pesquisa_mercado") as conn:
             conn.execute(text("SELECT 1"))
         st.success("✅ Conexão com o banco de dados estabelecida com sucesso!")
         return engine_
@@ -28,19 +37,23 @@ def get_database_engine_for_app(db_url):
         st.error(f"   Detalhes: {e}")
         st.stop()
 
-engine = get_database_engine_for_app(DATABASE_URL)
+engine = get_database_engine_for_app()
 
 # --- Initialize session_state ---
-for key in ['df_cnpjs', 'resumo_crescimento', 'df_oportunidades', 'df_coords']:
+for key in ['df_cnpjs', 'resumo_crescimento', 'df_oportunidades', 'df_coords', 'paginacao']:
     if key not in st.session_state:
         st.session_state[key] = None
 if 'query_sql_display' not in st.session_state:
     st.session_state['query_sql_display'] = ""
+if 'query_params' not in st.session_state:
+    st.session_state['query_params'] = {}
+if 'plano_consulta' not in st.session_state:
+    st.session_state['plano_consulta'] = None
 if 'query_sql_display_crescimento' not in st.session_state:
     st.session_state['query_sql_display_crescimento'] = ""
 
 # --- Funções cacheadas ---
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=300, max_entries=20)
 def process_dataframe_for_analysis(df_input):
     if df_input is None or df_input.empty:
         return pd.DataFrame()
@@ -59,47 +72,103 @@ def process_dataframe_for_analysis(df_input):
     df['faixa_capital'] = pd.cut(df['capital_social'], bins=bins_capital, labels=labels_capital, right=False)
 
     if 'bairro' in df.columns:
-        df['bairro_normalizado'] = df['bairro'].apply(lambda b: unidecode(str(b).upper().split('/')[0].strip()))
+        df['bairro_normalizado'] = normalizar_coluna(df['bairro'], 'bairro')
     return df
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=300, max_entries=20)
 def get_word_counts(df, column_name):
     if df.empty or column_name not in df.columns:
         return pd.DataFrame()
-    stop_words = set(unidecode(w.lower()) for w in [
+    stop_words = [
         "e","de","do","da","dos","das","o","a","os","as","um","uma","uns","umas",
         "para","com","sem","em","no","na","nos","nas","ao","aos","por","pelo",
         "pela","pelos","pelas","ou","nem","mas","mais","menos","desde","até",
         "após","entre","contra","servicos","comercio","industria","vendas",
         "consultoria","digital","online","brasil","grupo","nova","importacao"
-    ])
-    def clean(text):
-        text = unidecode(str(text).lower())
-        text = re.sub(r'[^\w\s]', '', text)
-        text = re.sub(r'\d+', '', text)
-        return [w for w in text.split() if w not in stop_words and len(w)>1]
-    all_words = df[column_name].apply(clean).explode().dropna()
-    if all_words.empty:
+    ]
+    dfc = contar_palavras(df[column_name], stop_words)
+    if dfc.empty:
         return pd.DataFrame()
-    dfc = pd.DataFrame(Counter(all_words).items(), columns=['Palavra','Frequência'])
-    return dfc.sort_values('Frequência', ascending=False)
+    return dfc.rename(columns={'palavra': 'Palavra', 'frequencia': 'Frequência'})
+
+ALIAS_CONTAGENS = {
+    'uf': 'UF', 'municipio':'Município', 'bairro_normalizado':'Bairro',
+    'porte_empresa':'Porte da Empresa','situacao_cadastral':'Situação Cadastral',
+    'faixa_capital':'Capital Social','faixa_idade':'Idade',
+    'qualificacao_socio':'Qualificação','faixa_etaria_socio':'Faixa Etária'
+}
 
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=300, max_entries=20)
 def get_column_counts(df, column_name):
     if df.empty or column_name not in df.columns:
         return pd.DataFrame()
     counts = df[column_name].value_counts().reset_index()
-    alias = {
-        'uf': 'UF', 'municipio':'Município', 'bairro_normalizado':'Bairro',
-        'porte_empresa':'Porte da Empresa','situacao_cadastral':'Situação Cadastral',
-        'faixa_capital':'Capital Social','faixa_idade':'Idade',
-        'qualificacao_socio':'Qualificação','faixa_etaria_socio':'Faixa Etária'
-    }
-    counts.columns = [alias.get(column_name, column_name), 'Total']
+    counts.columns = [ALIAS_CONTAGENS.get(column_name, column_name), 'Total']
     return counts
 
+# Mesmas dimensões e faixas de process_dataframe_for_analysis, calculadas no Postgres
+DIMENSOES_AGREGADAS = {
+    'uf': "uf",
+    'municipio': "municipio",
+    'bairro_normalizado': "upper(trim(split_part(unaccent(bairro), '/', 1)))",
+    'porte_empresa': "porte_empresa",
+    'situacao_cadastral': "situacao_cadastral",
+    'faixa_capital': """CASE
+            WHEN COALESCE(capital_social, 0) < 0 THEN NULL
+            WHEN COALESCE(capital_social, 0) < 50000 THEN 'Até 50k'
+            WHEN capital_social < 100000 THEN '50k-100k'
+            WHEN capital_social < 500000 THEN '100k-500k'
+            WHEN capital_social < 1000000 THEN '500k-1M'
+            WHEN capital_social < 5000000 THEN '1M-5M'
+            ELSE 'Acima de 5M' END""",
+    'faixa_idade': """CASE
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 0 THEN NULL
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 1 THEN '≤1'
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 2 THEN '1-2'
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 3 THEN '2-3'
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 5 THEN '3-5'
+            WHEN (CURRENT_DATE - data_inicio_atividade::date) / 365 < 10 THEN '5-10'
+            WHEN data_inicio_atividade IS NOT NULL THEN '>10' END""",
+}
+
+def montar_sql_agregacao(espec):
+    where, params = compilar_where(espec)
+    colunas = list(DIMENSOES_AGREGADAS)
+    selecao = ",\n            ".join(f"{expr} AS {col}" for col, expr in DIMENSOES_AGREGADAS.items())
+    sql = f"""
+    WITH filtrado AS (
+        SELECT
+            {selecao}
+        FROM {TABELA}
+        WHERE {' AND '.join(where) or 'TRUE'}
+    )
+    SELECT {', '.join(colunas)},
+        {', '.join(f'GROUPING({c}) AS g_{c}' for c in colunas)},
+        COUNT(*) AS total
+    FROM filtrado
+    GROUP BY GROUPING SETS ({', '.join(f'({c})' for c in colunas)})
+    """
+    return sql, params
+
+@st.cache_data(ttl=TTL_SEM_VERSAO_HORAS * 3600, max_entries=50)
+def agregar_no_banco(impressao, versao, _espec):
+    """
+    Contagens por dimensão sobre todo o universo filtrado (sem LIMIT), num único GROUPING SETS.
+    O cache é chaveado pela impressão digital da especificação e pela versão da base; sem versão
+    (view comum) só o TTL de cache_resultados invalida.
+    """
+    sql, params = montar_sql_agregacao(_espec)
+    df = ler_sql_em_blocos(sql, params, pagina="pesquisa_mercado")
+    contagens = {}
+    for coluna in DIMENSOES_AGREGADAS:
+        parte = df[(df[f"g_{coluna}"] == 0) & df[coluna].notna()]
+        counts = parte[[coluna, 'total']].sort_values('total', ascending=False).reset_index(drop=True)
+        counts.columns = [ALIAS_CONTAGENS.get(coluna, coluna), 'Total']
+        contagens[coluna] = counts
+    return contagens
+
 # NOVA FUNÇÃO: Processa CNAEs para a pesquisa de mercado (contando principais e secundários)
-@st.cache_data(ttl=300)
+@st.cache_data(ttl=300, max_entries=20)
 def get_cnae_counts_for_market_research(df_input):
     if df_input is None or df_input.empty:
         return pd.DataFrame()
@@ -121,115 +190,38 @@ def get_cnae_counts_for_market_research(df_input):
     df_cnaes = pd.DataFrame(cnae_counts.items(), columns=['CNAE', 'Total'])
     return df_cnaes.sort_values('Total', ascending=False)
 
-def montar_sql(f, limit):
-    where = ["situacao_cadastral = 'ATIVA'"]
-
-    def regex_pipe_field_clauses(col, termos):
-        clauses = []
-        for termo in termos:
-            termo = termo.strip()
-            if termo:
-                termo_regex = f"(^|\\|\\s*){re.escape(termo)}(\\s*\\||$)"
-                clauses.append(f"{col} ~* '{termo_regex}'")
-        return clauses
-
-
-    def ilike_clauses(col, termos):
-        return [f"{col} ILIKE unaccent('%{t}%')" for t in termos if t.strip()]
-
-    def in_clause(col, lista):
-        l = [f"'{x.replace(chr(39), chr(39)*2)}'" for x in lista if x.strip()]
-        return f"{col} IN ({','.join(l)})" if l else ""
-
-    # Sempre começar com UF e Município
-    if f.get('uf_selecionada'):
-        where.append(in_clause('uf_normalizado', f['uf_selecionada']))
-    if f.get('municipio_termos'):
-        termos = f['municipio_termos']
-        clauses = ilike_clauses('municipio_normalizado', termos)
-        if clauses:
-            where.append(f"({' OR '.join(clauses)})")
-
-    # Filtros por texto (com campos normalizados)
-    texto_fields_normais = {
-        'razao_social': 'razao_social_normalizado',
-        'nome_fantasia': 'nome_fantasia_normalizado',
-        'cnae_principal': 'cnae_principal_normalizado',
-        'natureza_juridica': 'natureza_juridica',
-        'bairro': 'bairro_normalizado',
-        'ddd': 'ddd1',
-        'logradouro': 'logradouro',
-    }
-
-    for key, column in texto_fields_normais.items():
-        termos = f.get(f"{key}_termos", [])
-        clauses = ilike_clauses(column, termos)
-        if clauses:
-            where.append(f"({' OR '.join(clauses)})")
-
-    pipe_fields = {
-        'qualificacao_socio_termos': 'qualificacoes',
-        'faixa_etaria_socio_termos': 'faixas_etarias'
-        }
-    
-    for key, column in pipe_fields.items():
-        termos = f.get(key, [])
-        clauses = regex_pipe_field_clauses(column, termos)
-        if clauses:
-            where.append(f"({' OR '.join(clauses)})")
-
-    # Filtros por valores fixos
-    if f.get('porte_selecionado'):
-        where.append(in_clause('porte_empresa', f['porte_selecionado']))
-
-    if f.get('opcao_simples') in ['S', 'N']:
-        where.append(f"opcao_simples = '{f['opcao_simples']}'")
-    if f.get('opcao_mei') in ['S', 'N']:
-        where.append(f"opcao_mei = '{f['opcao_mei']}'")
-
-    # Filtros por capital
-    if f.get('capital_social_min') is not None:
-        where.append(f"capital_social >= {f['capital_social_min']}")
-    if f.get('capital_social_max') is not None:
-        where.append(f"capital_social <= {f['capital_social_max']}")
-
-    # Filtros por datas
-    if f.get('data_abertura_apos'):
-        dt_str = f['data_abertura_apos'].strftime("%Y-%m-%d")
-        where.append(f"data_inicio_atividade >= '{dt_str}'")
-    if f.get('data_abertura_antes'):
-        dt_str = f['data_abertura_antes'].strftime("%Y-%m-%d")
-        where.append(f"data_inicio_atividade <= '{dt_str}'")
-
-    # Filtros por idade
-    for key in ['idade_min', 'idade_max']:
-        if f.get(key) is not None:
-            op = ">=" if 'min' in key else "<="
-            where.append(f"DATE_PART('year', AGE(CURRENT_DATE, data_inicio_atividade)) {op} {f[key]}")
-
-    # Quantidade de Sócios
-    if f.get('qtde_socios_min') is not None:
-        where.append(f"qtde_socios >= {f['qtde_socios_min']}")
-    if f.get('qtde_socios_max') is not None:
-        where.append(f"qtde_socios <= {f['qtde_socios_max']}")
-
-    # Filtro por código CNAE direto (agora já está na tabela)
-    if f.get('cod_cnae_termos'):
-        termos_cnae = [t.strip() for t in f['cod_cnae_termos'] if t.strip()]
-        if termos_cnae:
-            termos_str = ','.join(f"'{t}'" for t in termos_cnae)
-            where.append(f"(cod_cnae_principal IN ({termos_str}) OR cod_cnae_secundario ILIKE ANY (ARRAY[{termos_str}]))")
+def montar_espec(f, limit=None):
+    # Os filtros da tela viram uma EspecFiltro canônica (filtros.py): mesmo SQL e mesma impressão digital
+    # para filtros equivalentes, com os valores indo como parâmetros
+    def termos(chave):
+        return f.get(chave) or []
+
+    condicoes = [
+        condicao('uf', 'igual', f.get('uf_selecionada')),
+        # Listas de termos: município, textos, sócios e código CNAE (principal ou secundários)
+        *(condicao(campo, operador, termos(chave)) for chave, (campo, operador) in PARAMETROS_CONSULTA.items()),
+        # Filtros por valores fixos
+        condicao('porte_empresa', 'igual', f.get('porte_selecionado')),
+        condicao('opcao_simples', 'igual', [f['opcao_simples']] if f.get('opcao_simples') in ['S', 'N'] else []),
+        condicao('opcao_mei', 'igual', [f['opcao_mei']] if f.get('opcao_mei') in ['S', 'N'] else []),
+        # Faixas: capital, datas, idade e quantidade de sócios
+        condicao('capital_social', 'entre', (f.get('capital_social_min'), f.get('capital_social_max'))),
+        condicao('data_inicio_atividade', 'entre', (f.get('data_abertura_apos'), f.get('data_abertura_antes'))),
+        condicao('data_inicio_atividade', 'idade_entre', (f.get('idade_min'), f.get('idade_max'))),
+        condicao('qtde_socios', 'entre', (f.get('qtde_socios_min'), f.get('qtde_socios_max'))),
+    ]
+    return especificar(condicoes, limite=limit)
 
-    sql = f"""
-    SELECT *
-    FROM {TABELA}
-    """
+def montar_sql(espec):
+    return compilar(espec, 'exportacao')
 
-    if where:
-        sql += " WHERE " + " AND ".join(where)
+def montar_sql_pagina(espec, ultimo_cnpj=None, tamanho=TAMANHO_PAGINA):
+    # Keyset: a próxima página começa depois do último cnpj da anterior, sem OFFSET
+    return compilar(espec, 'preview', apos_cnpj=ultimo_cnpj, tamanho_pagina=tamanho)
 
-    sql += f" LIMIT {limit};"
-    return sql
+def carregar_pagina(paginacao):
+    sql, params = montar_sql_pagina(paginacao["espec"], paginacao["cursores"][-1])
+    paginacao["df"] = ler_sql_em_blocos(sql, params, pagina="pesquisa_mercado")
 
 # --- opções fixes ---
 @st.cache_data(ttl=3600)
@@ -237,22 +229,104 @@ def get_uf_options(_): return ["AC","AL","AP","AM","BA","CE","DF","ES","GO","MA"
 @st.cache_data(ttl=3600)
 def get_porte_options(): return ["ME","EPP","DEMAIS"]
 
-@st.cache_data(ttl=300)
-def run_query(sql, _engine):
+@st.cache_data(ttl=3600)
+def get_municipio_options(ufs):
+    # Municípios das UFs escolhidas, direto da base (quando não há resultado completo carregado)
+    if not ufs:
+        return []
+    clausulas, params = compilar_where(especificar([condicao('uf', 'igual', list(ufs))]))
+    sql = f"SELECT DISTINCT municipio FROM {TABELA} WHERE {' AND '.join(clausulas)} ORDER BY municipio"
+    df = run_query(sql, params)
+    return df['municipio'].dropna().tolist() if 'municipio' in df.columns else []
+
+@st.cache_data(ttl=3600)
+def get_colunas_indexadas():
     try:
-        df = pd.read_sql(text(sql), engine.connect())
+        with conexao("pesquisa_mercado") as conn:
+            return {c for c, (_, valido) in verificar_indices(conn, TABELA).items() if valido}
+    except Exception:
+        return set()
+
+def ler_e_guardar(chave, sql, params=None, progresso=None):
+    df = ler_sql_em_blocos(sql, params, pagina="pesquisa_mercado", progresso=progresso)
+    gravar_resultado(chave, df)
+    return df
+
+def run_query(sql, params=None, progresso=None):
+    # Cache em disco compartilhado (cache_resultados.py), válido até a próxima carga da base;
+    # a mesma consulta já em andamento em outra sessão é aguardada em vez de repetida
+    chave = chave_sql(sql, params)
+    df = ler_resultado(chave)
+    if df is not None:
         return df
+    try:
+        return executar_uma_vez(chave, ler_e_guardar, chave, sql, params, progresso)
     except Exception as e:
         st.error(f"Erro ao executar consulta: {e}")
         return pd.DataFrame()
 
+def usar_resultado_em_cache(espec):
+    # Resultado completo já guardado para estes filtros: dispensa a estimativa e a consulta
+    df = ler_resultado(chave_resultado(espec, 'exportacao'))
+    if df is None:
+        return False
+    st.session_state.df_cnpjs = df
+    st.session_state.plano_consulta = None
+    st.success(f"Consulta concluída! {len(df)} resultados encontrados (cache local).")
+    return True
+
+def consultar_empresas(conn, sql, params=None, diagnostico=False, progresso=None):
+    # Roda em segundo plano (tarefas.iniciar_tarefa): nada de st.* aqui
+    return executar_uma_vez((chave_sql(sql, params), diagnostico), _consultar_empresas, conn, sql, params, diagnostico, progresso)
+
+def _consultar_empresas(conn, sql, params, diagnostico, progresso):
+    df = ler_sql_na_conexao(conn, sql, params, progresso=progresso)
+    plano = explicar_consulta(conn, sql, params) if diagnostico else None
+    return df, plano
+
+def barra_de_progresso(total_esperado, rotulo="Linhas recebidas"):
+    barra = st.progress(0.0, text=f"{rotulo}: 0")
+    def atualizar(linhas_lidas):
+        barra.progress(min(linhas_lidas / max(total_esperado, 1), 1.0), text=f"{rotulo}: {linhas_lidas:,}")
+    return barra, atualizar
+
 def etapa2():
     st.header("2️⃣ Análise Gráfica")
+    espec = st.session_state.get('espec_consulta')
+    agregacao_no_banco = st.checkbox(
+        "Calcular as contagens no banco (todo o universo filtrado, sem LIMIT)",
+        value=False,
+        disabled=espec is None,
+        key="agregacao_no_banco",
+        help="Localização, porte, situação, capital e idade passam a ser agregados no Postgres. "
+             "Palavras-chave, CNAE e sócios continuam usando o resultado carregado.",
+    )
     df = process_dataframe_for_analysis(st.session_state.df_cnpjs)
-    if df.empty:
+    # Navegação por páginas: sem o resultado completo na sessão, as contagens vêm do banco
+    if df.empty and espec is not None and st.session_state.get('paginacao') and not agregacao_no_banco:
+        st.info("Só uma página do resultado está carregada: localização, porte, situação, capital e idade são "
+                "agregados no banco. Palavras-chave, CNAE e sócios precisam de \"Carregar resultado completo\".")
+        agregacao_no_banco = True
+
+    contagens = None
+    if agregacao_no_banco and espec is not None:
+        try:
+            with st.spinner("Agregando no banco de dados..."):
+                contagens = agregar_no_banco(impressao_digital(espec), versao_base(), espec)
+        except Exception as e:
+            st.error(f"Erro ao agregar no banco de dados: {e}")
+
+    if df.empty and contagens is None:
         st.warning("Nenhum dado carregado.")
         return
 
+    import plotly.express as px  # só quando há dados para os gráficos
+
+    def contar(coluna):
+        if contagens is not None and coluna in contagens:
+            return contagens[coluna]
+        return get_column_counts(df, coluna)
+
     tab_titles = [
         "Palavras Chave (Nome Fantasia)",
         "Localização",
@@ -299,7 +373,7 @@ def etapa2():
         loc_tabs = st.tabs(["Por UF", "Por Município", "Por Bairro"])
 
         with loc_tabs[0]:
-            df_uf_counts = get_column_counts(df, 'uf')
+            df_uf_counts = contar('uf')
             if not df_uf_counts.empty:
                 fig_uf = px.bar(df_uf_counts, x='UF', y='Total', title='Empresas por UF', color='Total', template='plotly_dark')
                 st.plotly_chart(fig_uf, use_container_width=True)
@@ -307,7 +381,7 @@ def etapa2():
                 st.info("Coluna 'uf' não encontrada ou está vazia. Não é possível gerar o gráfico de UF.")
 
         with loc_tabs[1]:
-            df_municipio_counts = get_column_counts(df, 'municipio')
+            df_municipio_counts = contar('municipio')
             if not df_municipio_counts.empty:
                 top_municipios_n = st.slider("Número de municípios para exibir:", min_value=10, max_value=50, value=20, key="top_municipios_slider_analise_grafica")
                 top_municipios = df_municipio_counts.head(top_municipios_n)
@@ -330,7 +404,7 @@ def etapa2():
                 st.info("Coluna 'municipio' não encontrada ou está vazia. Não é possível gerar o gráfico de Município.")
 
         with loc_tabs[2]:
-            df_bairro_counts = get_column_counts(df, 'bairro_normalizado')
+            df_bairro_counts = contar('bairro_normalizado')
             if not df_bairro_counts.empty:
                 top_bairros_n = st.slider("Número de bairros para exibir:", min_value=10, max_value=50, value=20, key="top_bairros_slider_analise_grafica")
                 top_bairros = df_bairro_counts.head(top_bairros_n)
@@ -408,7 +482,7 @@ def etapa2():
 
     with tabs[3]:
         st.subheader("📊 Análise por Porte da Empresa")
-        df_porte_counts = get_column_counts(df, 'porte_empresa')
+        df_porte_counts = contar('porte_empresa')
         if not df_porte_counts.empty:
             fig_porte = px.pie(df_porte_counts, names='Porte da Empresa', values='Total', title='Empresas por Porte', template='seaborn')
             st.plotly_chart(fig_porte, use_container_width=True)
@@ -417,7 +491,7 @@ def etapa2():
 
     with tabs[4]:
         st.subheader("📊 Análise por Situação Cadastral")
-        df_situacao_counts = get_column_counts(df, 'situacao_cadastral')
+        df_situacao_counts = contar('situacao_cadastral')
         if not df_situacao_counts.empty:
             fig_situacao = px.bar(df_situacao_counts, x='Situação Cadastral', y='Total', color='Total', template='plotly_dark')
             st.plotly_chart(fig_situacao, use_container_width=True)
@@ -426,7 +500,7 @@ def etapa2():
 
     with tabs[5]:
         st.subheader("📊 Análise por Faixa de Capital Social")
-        df_cap_counts = get_column_counts(df, 'faixa_capital')
+        df_cap_counts = contar('faixa_capital')
         if not df_cap_counts.empty:
             ordered_categories = ["Até 50k", "50k-100k", "100k-500k", "500k-1M", "1M-5M", "Acima de 5M"]
             df_cap_counts['Capital Social'] = pd.Categorical(df_cap_counts['Capital Social'], categories=ordered_categories, ordered=True)
@@ -438,7 +512,7 @@ def etapa2():
 
     with tabs[6]:
         st.subheader("📊 Análise por Faixa de Idade da Empresa")
-        df_idade_counts = get_column_counts(df, 'faixa_idade')
+        df_idade_counts = contar('faixa_idade')
         if not df_idade_counts.empty:
             ordered_categories_idade = ["≤1", "1-2", "2-3", "3-5", "5-10", ">10"]
             df_idade_counts['Idade'] = pd.Categorical(df_idade_counts['Idade'], categories=ordered_categories_idade, ordered=True)
@@ -466,6 +540,8 @@ def etapa2():
 
 
 # --- Layout do aplicativo ---
+modo_diagnostico = modo_diagnostico_ativo()
+
 tab_consulta, tab_analise_grafica, tab_pesquisa_mercado = st.tabs(["Consulta Avançada de Empresas", "Análise Gráfica dos Dados Enriquecidos", "Pesquisa de Mercado (Novas Empresas)"])
 
 with tab_consulta:
@@ -533,6 +609,13 @@ with tab_consulta:
 
     limit_resultados = st.slider("Número Máximo de Resultados (LIMIT)", min_value=1000, max_value=100000, value=5000, step=1000, key="limit_resultados")
 
+    modo_paginado = st.checkbox(
+        f"Navegar pelos resultados em páginas de {TAMANHO_PAGINA} (o resultado completo só é carregado para exportação)",
+        value=False,
+        key="modo_paginado",
+    )
+
+    estimativa = None
     if st.button("🔎 Realizar Consulta", key="btn_realizar_consulta"):
         filtros = {
             'razao_social_termos': [t.strip() for t in razao_social_input.split(',') if t.strip()],
@@ -560,40 +643,98 @@ with tab_consulta:
             'qtde_socios_max': qtde_socios_max
         }
 
-        sql_final = montar_sql(filtros, limit_resultados)
+        espec = montar_espec(filtros, limit_resultados)
+        sql_final, params_consulta = montar_sql(espec)
         st.session_state.query_sql_display = sql_final
-        
-        with st.spinner("Buscando dados no banco de dados..."):
-            df_resultados = run_query(sql_final, engine)
+        st.session_state.query_params = params_consulta
+        st.session_state.espec_consulta = espec
+        st.session_state.pop("preflight_consulta", None)
+        if modo_paginado:
+            st.session_state.df_cnpjs = None
+            st.session_state.paginacao = {"espec": espec, "cursores": [None], "df": None}
+            try:
+                carregar_pagina(st.session_state.paginacao)
+            except Exception as e:
+                st.error(f"Erro ao executar consulta: {e}")
+                st.session_state.paginacao = None
+        else:
+            st.session_state.paginacao = None
+        if not modo_paginado and (modo_diagnostico or not usar_resultado_em_cache(espec)):
+            try:
+                estimativa = estimar_resultado(sql_final, params_consulta, pagina="pesquisa_mercado")
+            except Exception as e:
+                st.error(f"Erro ao estimar o tamanho do resultado: {e}")
+
+    paginacao = st.session_state.paginacao
+    if modo_paginado and paginacao is not None and paginacao["df"] is not None:
+        st.markdown("### 📋 Resultados da Consulta")
+        numero_pagina = len(paginacao["cursores"])
+        col_ant, col_info, col_prox, col_export = st.columns([1, 2, 1, 2])
+        anterior = col_ant.button("◀ Anterior", key="pagina_anterior", disabled=numero_pagina == 1)
+        proxima = col_prox.button("Próxima ▶", key="pagina_proxima", disabled=len(paginacao["df"]) < TAMANHO_PAGINA)
+        if anterior:
+            paginacao["cursores"].pop()
+            carregar_pagina(paginacao)
+        elif proxima:
+            paginacao["cursores"].append(paginacao["df"]["cnpj"].iloc[-1])
+            carregar_pagina(paginacao)
+        col_info.markdown(f"Página **{len(paginacao['cursores'])}** · {len(paginacao['df'])} linhas, em ordem de CNPJ")
+        if (col_export.button("📦 Carregar resultado completo (exportar/analisar)", key="carregar_resultado_completo")
+                and (modo_diagnostico or not usar_resultado_em_cache(st.session_state.espec_consulta))):
+            try:
+                estimativa = estimar_resultado(
+                    st.session_state.query_sql_display, st.session_state.query_params, pagina="pesquisa_mercado"
+                )
+            except Exception as e:
+                st.error(f"Erro ao estimar o tamanho do resultado: {e}")
+
+        st.dataframe(paginacao["df"], use_container_width=True)
+
+    if confirmar_execucao("preflight_consulta", estimativa):
+        st.session_state.plano_consulta = None
+        st.session_state.chave_resultado_consulta = chave_resultado(st.session_state.espec_consulta, 'exportacao')
+        iniciar_tarefa(
+            "tarefa_consulta", "pesquisa_mercado", consultar_empresas,
+            st.session_state.query_sql_display, st.session_state.query_params, diagnostico=modo_diagnostico, rotulo="Buscando dados no banco de dados",
+            total_esperado=limit_resultados, com_progresso=True,
+        )
+
+    tarefa_consulta = acompanhar_tarefa("tarefa_consulta")
+    if tarefa_consulta is not None:
+        if tarefa_consulta.status == CONCLUIDA:
+            df_resultados, plano = tarefa_consulta.resultado
+            df_resultados, mb_antes, mb_depois = compactar(df_resultados)
             st.session_state.df_cnpjs = df_resultados
+            gravar_resultado(st.session_state.chave_resultado_consulta, df_resultados)
             st.success(f"Consulta concluída! {len(df_resultados)} resultados encontrados.")
-
-        # Limpar o cache das funções dependentes do DataFrame principal
-        process_dataframe_for_analysis.clear()
-        get_word_counts.clear()
-        get_column_counts.clear()
-        get_cnae_counts_for_market_research.clear() # Limpa o cache da nova função também
+            st.caption(resumo_memoria(mb_antes, mb_depois))
+            if plano is not None:
+                st.session_state.plano_consulta = registrar_plano(plano, "pesquisa_mercado")
+        elif tarefa_consulta.status == CANCELADA:
+            st.warning("Consulta cancelada.")
+        else:
+            st.error(f"Erro ao executar consulta: {tarefa_consulta.erro}")
 
     if st.session_state.query_sql_display:
         with st.expander("Ver a query SQL gerada", expanded=False):
             st.code(st.session_state.query_sql_display, language="sql")
+            if st.session_state.query_params:
+                st.caption("Parâmetros:")
+                st.json(st.session_state.query_params, expanded=False)
+            avaliacao_indices = avaliar_predicados(
+                st.session_state.query_sql_display, get_colunas_indexadas(), st.session_state.query_params
+            )
+            if avaliacao_indices:
+                st.caption("Uso de índices trigram pelos filtros de texto (crie os que faltam com `python indices.py criar`):")
+                st.dataframe(pd.DataFrame(avaliacao_indices), use_container_width=True)
+        if st.session_state.plano_consulta:
+            painel_plano(st.session_state.plano_consulta)
 
     if st.session_state.df_cnpjs is not None and not st.session_state.df_cnpjs.empty:
-        st.markdown("### 📋 Resultados da Consulta")
-        #st.dataframe(st.session_state.df_cnpjs, use_container_width=True) --se ativo mostra todas as colunas do Dataframe
-        colunas_para_omitir = [
-            'razao_social_normalizado',
-            'nome_fantasia_normalizado',
-            'municipio_normalizado',
-            'bairro_normalizado',
-            'uf_normalizado',
-            'cnae_principal_normalizado',
-            'cnae_secundario_normalizado'  # adicione outras colunas se necessário
-        ]
-
-        df_visivel = st.session_state.df_cnpjs.drop(columns=[c for c in colunas_para_omitir if c in st.session_state.df_cnpjs.columns])
-
-        st.dataframe(df_visivel, use_container_width=True)
+        st.markdown("### 📦 Resultado Completo" if modo_paginado else "### 📋 Resultados da Consulta")
+        # As colunas *_normalizado já não vêm do banco (SELECT com a lista de colunas de exportação)
+        if not modo_paginado:
+            st.dataframe(st.session_state.df_cnpjs, use_container_width=True)
 
 
         total_cnpjs_distintos = st.session_state.df_cnpjs['cnpj'].nunique()
@@ -664,14 +805,18 @@ with tab_pesquisa_mercado:
     )
     n_meses_analise = validate_n_meses(n_meses_analise_str)
 
+    # Opções a partir do resultado carregado; sem ele (navegação por páginas), a partir da base
+    df_carregado = st.session_state.get('df_cnpjs')
+    tem_resultado = df_carregado is not None and {'uf', 'municipio'} <= set(df_carregado.columns)
     filtro_uf_pesquisa = st.sidebar.multiselect(
         "Filtrar por UF:",
-        options=st.session_state.df_cnpjs['uf'].unique().tolist() if 'df_cnpjs' in st.session_state and st.session_state.df_cnpjs is not None and 'uf' in st.session_state.df_cnpjs.columns else [],
+        options=df_carregado['uf'].dropna().unique().tolist() if tem_resultado else get_uf_options(None),
         key="filtro_uf_pesquisa"
     )
     filtro_municipio_pesquisa = st.sidebar.multiselect(
         "Filtrar por Município:",
-        options=st.session_state.df_cnpjs['municipio'].unique().tolist() if 'df_cnpjs' in st.session_state and st.session_state.df_cnpjs is not None and 'municipio' in st.session_state.df_cnpjs.columns else [],
+        options=(df_carregado['municipio'].dropna().unique().tolist() if tem_resultado
+                 else get_municipio_options(tuple(filtro_uf_pesquisa))),
         key="filtro_municipio_pesquisa"
     )
     filtro_nome_fantasia_pesquisa = st.sidebar.text_input(
@@ -696,24 +841,15 @@ with tab_pesquisa_mercado:
 
             data_limite = datetime.date.today() - datetime.timedelta(days=n_meses_analise * 30)
 
-            dedicated_filters_sql_clause = []
-
-            if filtro_uf_pesquisa:
-                ufs_str = "', '".join(filtro_uf_pesquisa)
-                dedicated_filters_sql_clause.append(f"uf_normalizado IN ('{ufs_str}')")
-
-            if filtro_municipio_pesquisa:
-                municipios_str = "', '".join(filtro_municipio_pesquisa)
-                dedicated_filters_sql_clause.append(f"municipio_normalizado IN ('{municipios_str}')")
-
-            if filtro_nome_fantasia_pesquisa:
-                nomes_fantasia_termos = [f"%{termo.strip()}%" for termo in filtro_nome_fantasia_pesquisa.split(',')]
-                termos_ilike = [f"nome_fantasia_normalizado ILIKE '{termo}'" for termo in nomes_fantasia_termos if termo.strip()]
-                dedicated_filters_sql_clause.append(f"({' OR '.join(termos_ilike)})")
-
-            final_dedicated_filter_sql = ""
-            if dedicated_filters_sql_clause:
-                final_dedicated_filter_sql = " AND " + " AND ".join(dedicated_filters_sql_clause)
+            # Mesmo compilador de filtros da Consulta Avançada (filtros.py): valores sempre como parâmetros
+            espec_crescimento = especificar([
+                condicao('uf', 'igual', filtro_uf_pesquisa),
+                condicao('municipio', 'igual', filtro_municipio_pesquisa),
+                condicao('nome_fantasia', 'contem', (filtro_nome_fantasia_pesquisa or "").split(',')),
+                condicao('data_inicio_atividade', 'entre', (data_limite, None)),
+            ])
+            clausulas, params_crescimento = compilar_where(espec_crescimento)
+            clausulas.append(f"{coluna_agrupamento}_normalizado IS NOT NULL")
 
             sql_crescimento = f"""
             SELECT
@@ -724,10 +860,7 @@ with tab_pesquisa_mercado:
             FROM
                 {TABELA}
             WHERE
-                data_inicio_atividade >= '{data_limite.strftime('%Y-%m-%d')}'
-                AND situacao_cadastral = 'ATIVA'
-                AND {coluna_agrupamento}_normalizado IS NOT NULL
-                {final_dedicated_filter_sql}
+                {' AND '.join(clausulas)}
             GROUP BY
                 {coluna_agrupamento}_normalizado, uf_normalizado, municipio_normalizado
             ORDER BY
@@ -739,7 +872,9 @@ with tab_pesquisa_mercado:
 
             with st.spinner(f"Analisando crescimento nos últimos {n_meses_analise} meses..."):
                 try:
-                    raw_df_crescimento = run_query(sql_crescimento, engine)
+                    barra, atualizar_progresso = barra_de_progresso(10000)
+                    raw_df_crescimento = run_query(sql_crescimento, params_crescimento, progresso=atualizar_progresso)
+                    barra.empty()
                     st.session_state.resumo_crescimento = raw_df_crescimento
                     st.success("Análise de crescimento concluída!")
                 except Exception as e:
@@ -751,6 +886,8 @@ with tab_pesquisa_mercado:
             st.code(st.session_state.query_sql_display_crescimento, language="sql")
 
     if 'resumo_crescimento' in st.session_state and st.session_state.resumo_crescimento is not None and not st.session_state.resumo_crescimento.empty:
+        import plotly.express as px
+
         plot_col_name = "bairro"
         value_col_name = "total_empresas"
 
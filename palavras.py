@@ -0,0 +1,63 @@
+# Contagem vetorizada de palavras-chave (nome fantasia, nomes de sócios)
+
+# palavras.py
+#
+# Nomes de empresas se repetem muito: cada valor distinto é tokenizado uma única vez (factorize) e as
+# palavras são contadas com o peso de quantas linhas têm aquele valor.
+
+import re
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from unidecode import unidecode
+
+_RE_PONTUACAO = re.compile(r"[^\w\s]")
+_RE_DIGITOS = re.compile(r"\d+")
+
+
+@lru_cache(maxsize=32)
+def _normalizar_stop_words(palavras):
+    return frozenset(unidecode(p).lower() for p in palavras)
+
+
+def stop_words(palavras):
+    """Conjunto de stop words sem acento e em minúsculas (normalizado uma vez por lista)."""
+    return _normalizar_stop_words(frozenset(palavras))
+
+
+def contar_palavras(serie, palavras_ignoradas=(), separador=None):
+    """
+    Frequência das palavras de `serie` (sem acento, minúsculas, sem pontuação e dígitos, mais de uma
+    letra), ignorando `palavras_ignoradas`. `separador` (ex.: '|') separa itens de uma mesma célula.
+    DataFrame com 'palavra' e 'frequencia', do mais para o menos frequente; empates na ordem da
+    primeira ocorrência.
+    """
+    serie = serie.dropna()
+    serie = serie[serie.astype(str).str.strip() != ""]
+    if serie.empty:
+        return pd.DataFrame(columns=["palavra", "frequencia"])
+
+    codigos, valores = pd.factorize(serie)
+    pesos = np.bincount(codigos, minlength=len(valores))
+
+    textos = pd.Series(valores).astype(str)
+    if separador:
+        textos = textos.str.replace(separador, " ", regex=False)
+    textos = textos.map(unidecode).str.lower()
+    textos = textos.str.replace(_RE_PONTUACAO, "", regex=True).str.replace(_RE_DIGITOS, "", regex=True)
+
+    tokens = pd.DataFrame({"palavra": textos.str.split(), "frequencia": pesos}).explode("palavra")
+    ignoradas = stop_words(palavras_ignoradas)
+    tokens = tokens[tokens["palavra"].notna()]
+    tokens = tokens[(tokens["palavra"].str.len() > 1) & ~tokens["palavra"].isin(ignoradas)]
+    if tokens.empty:
+        return pd.DataFrame(columns=["palavra", "frequencia"])
+
+    contagem = tokens.groupby("palavra", sort=False)["frequencia"].sum().reset_index()
+    return contagem.sort_values("frequencia", ascending=False, kind="stable").reset_index(drop=True)
+
+
+def top_palavras(serie, top_n, palavras_ignoradas=(), separador=None):
+    """Lista das `top_n` palavras mais frequentes."""
+    return contar_palavras(serie, palavras_ignoradas, separador)["palavra"].head(top_n).tolist()
@@ -0,0 +1,95 @@
+# Relatório do tempo de importação de cada página (custo de cold start dos workers)
+
+# perfil_importacao.py
+#
+# Uso:
+#   python perfil_importacao.py                         -> todas as páginas (Home.py e pages/*.py)
+#   python perfil_importacao.py "pages/Pesquisa de Mercado.py"
+#   python perfil_importacao.py --orcamento-ms 1500     -> sai com código 1 se alguma página passar do orçamento
+#
+# Para cada página, executa só os imports do nível do módulo num interpretador novo com -X importtime
+# e soma o tempo cumulativo por módulo importado diretamente. Imports feitos dentro de funções ou blocos
+# (carregamento preguiçoso, ex.: plotly só quando há gráfico) ficam de fora, que é o que se quer medir.
+
+import ast
+import glob
+import os
+import subprocess
+import sys
+
+DIRETORIO_APP = os.path.dirname(os.path.abspath(__file__))
+MARCADOR = "--imports-da-pagina--"
+ORCAMENTO_MS = float(os.getenv("PERFIL_IMPORTACAO_ORCAMENTO_MS", "0"))  # 0: sem orçamento
+
+
+def paginas():
+    return [os.path.join(DIRETORIO_APP, "Home.py")] + sorted(glob.glob(os.path.join(DIRETORIO_APP, "pages", "*.py")))
+
+
+def imports_da_pagina(caminho):
+    """Código-fonte dos imports no nível do módulo da página, na ordem em que aparecem."""
+    with open(caminho, encoding="utf-8") as f:
+        arvore = ast.parse(f.read(), filename=caminho)
+    return [ast.unparse(no) for no in arvore.body if isinstance(no, (ast.Import, ast.ImportFrom))]
+
+
+def medir_pagina(caminho):
+    """
+    Dict {módulo: ms cumulativos} dos módulos importados diretamente pela página num processo novo
+    (os já carregados pelo interpretador antes da página não entram).
+    """
+    codigo = "\n".join([f"import sys; sys.stderr.write({MARCADOR!r} + '\\n')"] + imports_da_pagina(caminho))
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", codigo],
+        cwd=DIRETORIO_APP, capture_output=True, text=True,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "falha ao importar")
+
+    linhas = processo.stderr.splitlines()
+    linhas = linhas[linhas.index(MARCADOR) + 1:] if MARCADOR in linhas else linhas
+    tempos = {}
+    for linha in linhas:
+        if not linha.startswith("import time:") or "cumulative" in linha:
+            continue
+        _, cumulativo, nome = linha[len("import time:"):].split("|")
+        profundidade = (len(nome) - len(nome.lstrip()) - 1) // 2
+        if profundidade == 0:
+            modulo = nome.strip()
+            tempos[modulo] = tempos.get(modulo, 0.0) + int(cumulativo) / 1000
+    return tempos
+
+
+def main(argv):
+    args = argv[1:]
+    orcamento = ORCAMENTO_MS
+    if "--orcamento-ms" in args:
+        i = args.index("--orcamento-ms")
+        try:
+            orcamento = float(args[i + 1])
+        except (IndexError, ValueError):
+            print("Uso: python perfil_importacao.py [--orcamento-ms N] [página.py ...]")
+            return 1
+        del args[i:i + 2]
+
+    estourou = False
+    for caminho in args or paginas():
+        nome = os.path.relpath(os.path.abspath(caminho), DIRETORIO_APP)
+        try:
+            tempos = medir_pagina(caminho)
+        except (OSError, SyntaxError, RuntimeError) as e:
+            print(f"{nome}: erro ({e})\n")
+            estourou = True
+            continue
+        total = sum(tempos.values())
+        acima = orcamento > 0 and total > orcamento
+        estourou = estourou or acima
+        print(f"{nome}: {total:,.0f} ms" + (f"  ACIMA DO ORÇAMENTO ({orcamento:,.0f} ms)" if acima else ""))
+        for modulo, ms in sorted(tempos.items(), key=lambda t: t[1], reverse=True):
+            print(f"  {ms:9,.1f} ms  {modulo}")
+        print()
+    return 1 if estourou else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
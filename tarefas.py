@@ -0,0 +1,200 @@
+# Execução de consultas longas em segundo plano, com cancelamento
+
+# tarefas.py
+#
+# Fluxo numa página:
+#   iniciar_tarefa("tarefa_x", "pagina", funcao, args...)   -> roda funcao(conn, *args) numa thread
+#   tarefa = acompanhar_tarefa("tarefa_x")                   -> None enquanto roda; a Tarefa quando termina
+#
+# Enquanto a tarefa roda, um fragmento com run_every consulta o andamento e renova o "sinal de vida".
+# Se o usuário fecha a aba ou troca de página, o sinal para e o vigia cancela a consulta no Postgres.
+
+import os
+import threading
+import time
+import uuid
+
+import streamlit as st
+from sqlalchemy import text
+
+from db import conexao, get_engine
+
+INTERVALO_POLL = float(os.getenv("TAREFAS_INTERVALO_POLL", "1.0"))        # segundos entre atualizações da página
+ABANDONO_SEGUNDOS = float(os.getenv("TAREFAS_ABANDONO_SEGUNDOS", "30"))   # sem sinal da página por este tempo -> cancela
+RETENCAO_SEGUNDOS = float(os.getenv("TAREFAS_RETENCAO_SEGUNDOS", "600"))  # tarefa encerrada e não coletada é descartada
+INTERVALO_VIGIA = 5.0
+
+EXECUTANDO = "executando"
+CONCLUIDA = "concluida"
+CANCELADA = "cancelada"
+ERRO = "erro"
+
+# Tarefa em execução na thread atual (para quem roda dentro de `funcao`, ex.: coalescencia.py)
+_local = threading.local()
+
+
+class Tarefa:
+    """Handle de uma consulta em segundo plano: status, resultado/erro, PID do backend e progresso."""
+
+    def __init__(self, pagina, rotulo, total_esperado=None):
+        self.id = uuid.uuid4().hex
+        self.pagina = pagina
+        self.rotulo = rotulo
+        self.total_esperado = total_esperado
+        self.status = EXECUTANDO
+        self.resultado = None
+        self.erro = None
+        self.pid = None
+        self.progresso = 0
+        self.cancelamento_solicitado = False
+        self.iniciada_em = time.time()
+        self.ultimo_sinal = self.iniciada_em
+        self.encerrada_em = None
+        # Protege o PID: o cancelamento termina antes de a conexão voltar ao pool
+        self._lock = threading.Lock()
+
+    @property
+    def em_andamento(self):
+        return self.status == EXECUTANDO
+
+    def registrar_progresso(self, valor):
+        self.progresso = valor
+
+    def sinalizar(self):
+        self.ultimo_sinal = time.time()
+
+
+def _executar(tarefa, funcao, args, kwargs):
+    _local.tarefa = tarefa
+    try:
+        with conexao(tarefa.pagina) as conn:
+            with tarefa._lock:
+                if tarefa.cancelamento_solicitado:
+                    raise RuntimeError("Consulta cancelada antes de começar.")
+                tarefa.pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+            try:
+                resultado = funcao(conn, *args, **kwargs)
+            finally:
+                with tarefa._lock:
+                    tarefa.pid = None
+        tarefa.resultado = resultado
+        tarefa.status = CONCLUIDA
+    except Exception as e:
+        tarefa.erro = e
+        tarefa.status = CANCELADA if tarefa.cancelamento_solicitado else ERRO
+    finally:
+        tarefa.encerrada_em = time.time()
+        _local.tarefa = None
+
+
+def cancelamento_solicitado():
+    """True se a tarefa que roda na thread atual teve o cancelamento pedido (False fora de tarefas)."""
+    tarefa = getattr(_local, "tarefa", None)
+    return tarefa is not None and tarefa.cancelamento_solicitado
+
+
+def cancelar_tarefa(tarefa):
+    """Marca a tarefa como cancelada e envia pg_cancel_backend para a consulta em execução."""
+    with tarefa._lock:
+        tarefa.cancelamento_solicitado = True
+        if tarefa.pid is None:
+            return False
+        with get_engine().connect() as conn:
+            return bool(conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": tarefa.pid}).scalar())
+
+
+def _vigiar(registro):
+    """Cancela tarefas cuja página parou de dar sinal e descarta as encerradas há muito tempo."""
+    while True:
+        time.sleep(INTERVALO_VIGIA)
+        agora = time.time()
+        with registro["lock"]:
+            tarefas = list(registro["tarefas"].values())
+        for tarefa in tarefas:
+            if tarefa.em_andamento:
+                if agora - tarefa.ultimo_sinal > ABANDONO_SEGUNDOS and not tarefa.cancelamento_solicitado:
+                    try:
+                        cancelar_tarefa(tarefa)
+                    except Exception:
+                        pass
+            elif agora - tarefa.encerrada_em > RETENCAO_SEGUNDOS:
+                with registro["lock"]:
+                    registro["tarefas"].pop(tarefa.id, None)
+
+
+@st.cache_resource
+def _registro():
+    """Registro de tarefas do processo (compartilhado entre sessões), com a thread vigia."""
+    registro = {"tarefas": {}, "lock": threading.Lock()}
+    threading.Thread(target=_vigiar, args=(registro,), daemon=True, name="vigia-tarefas").start()
+    return registro
+
+
+def obter_tarefa(chave):
+    """Tarefa guardada em st.session_state[chave], ou None."""
+    registro = _registro()
+    with registro["lock"]:
+        return registro["tarefas"].get(st.session_state.get(chave))
+
+
+def iniciar_tarefa(chave, pagina, funcao, *args, rotulo="Executando consulta", total_esperado=None, com_progresso=False, **kwargs):
+    """
+    Roda `funcao(conn, *args, **kwargs)` numa thread, numa transação com o statement_timeout da página,
+    e guarda o handle em st.session_state[chave]. Uma tarefa anterior na mesma chave é cancelada.
+    Com `com_progresso`, a função recebe `progresso=` para informar as linhas lidas.
+    `funcao` roda fora do contexto do Streamlit: não pode chamar st.*.
+    """
+    anterior = obter_tarefa(chave)
+    if anterior is not None and anterior.em_andamento:
+        cancelar_tarefa(anterior)
+
+    tarefa = Tarefa(pagina, rotulo, total_esperado)
+    if com_progresso:
+        kwargs["progresso"] = tarefa.registrar_progresso
+    registro = _registro()
+    with registro["lock"]:
+        registro["tarefas"][tarefa.id] = tarefa
+    st.session_state[chave] = tarefa.id
+    threading.Thread(target=_executar, args=(tarefa, funcao, args, kwargs), daemon=True, name=f"tarefa-{pagina}").start()
+    return tarefa
+
+
+@st.fragment(run_every=INTERVALO_POLL)
+def _painel_tarefa(chave):
+    tarefa = obter_tarefa(chave)
+    if tarefa is None or not tarefa.em_andamento:
+        st.rerun()
+    tarefa.sinalizar()
+
+    decorrido = time.time() - tarefa.iniciada_em
+    if tarefa.total_esperado:
+        st.progress(
+            min(tarefa.progresso / max(tarefa.total_esperado, 1), 1.0),
+            text=f"⏳ {tarefa.rotulo}... {tarefa.progresso:,} linhas ({decorrido:.0f}s)",
+        )
+    else:
+        st.info(f"⏳ {tarefa.rotulo}... ({decorrido:.0f}s)")
+    if tarefa.cancelamento_solicitado:
+        st.caption("Cancelamento solicitado, aguardando o banco de dados...")
+    elif st.button("✖️ Cancelar consulta", key=f"cancelar_{chave}"):
+        cancelar_tarefa(tarefa)
+
+
+def acompanhar_tarefa(chave):
+    """
+    Enquanto a tarefa de `chave` roda, mostra o andamento com um botão de cancelar e retorna None.
+    Quando ela termina, remove-a da sessão e a retorna (status CONCLUIDA, CANCELADA ou ERRO).
+    """
+    tarefa = obter_tarefa(chave)
+    if tarefa is None:
+        st.session_state.pop(chave, None)
+        return None
+    if tarefa.em_andamento:
+        _painel_tarefa(chave)
+        return None
+
+    st.session_state.pop(chave, None)
+    registro = _registro()
+    with registro["lock"]:
+        registro["tarefas"].pop(tarefa.id, None)
+    return tarefa
@@ -0,0 +1,41 @@
+# CSV enviado ao COPY a partir de DataFrames compactados (tipagem.compactar)
+
+import numpy as np
+import pandas as pd
+
+from db import buffer_csv_copy
+from tipagem import compactar
+
+
+def _linhas(df):
+    return buffer_csv_copy(df).getvalue().splitlines()
+
+
+def test_inteiro_com_nulo_sai_sem_casa_decimal():
+    df = pd.DataFrame({
+        "cnpj": ["00000000000191", "00000000000272"],
+        "qtde_socios": [2, np.nan],
+        "capital_social": [1500.0, 10.5],
+    })
+    assert df["qtde_socios"].dtype == "float64"
+    assert _linhas(df) == ["00000000000191,2,1500.0", "00000000000272,,10.5"]
+
+
+def test_frame_compactado():
+    df, _, _ = compactar(pd.DataFrame({
+        "cnpj": ["00000000000191", "00000000000272", "00000000000353"],
+        "ddd1": ["11", None, "11"],
+        "capital_social": ["1000", "2500.50", None],
+        "qtde_socios": [3, 1, 2],
+        "codigo": pd.Series([4711302.0, np.nan, 5611201.0], dtype="category"),
+    }))
+    assert _linhas(df) == [
+        "00000000000191,11,1000.0,3,4711302",
+        "00000000000272,,2500.5,1,",
+        "00000000000353,11,,2,5611201",
+    ]
+
+
+def test_float_em_coluna_object():
+    df = pd.DataFrame({"cnpj": ["1", "2", "3"], "qtde_socios": pd.Series([1.0, None, 4.0], dtype=object)})
+    assert _linhas(df) == ["1,1", "2,", "3,4"]
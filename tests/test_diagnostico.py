@@ -0,0 +1,32 @@
+# Aviso de seq scan sobre a base quando ela é uma view comum (o plano só cita as tabelas de origem)
+
+from diagnostico import TABELA_BASE, resumir_plano
+
+
+def _plano(relacao):
+    return {
+        "Plan": {
+            "Node Type": "Hash Join", "Actual Total Time": 10.0, "Actual Rows": 5,
+            "Plans": [
+                {"Node Type": "Seq Scan", "Relation Name": relacao, "Actual Total Time": 8.0, "Actual Rows": 5},
+                {"Node Type": "Index Scan", "Relation Name": "socios", "Actual Total Time": 1.0, "Actual Rows": 5},
+            ],
+        },
+        "Execution Time": 10.5,
+        "Planning Time": 0.3,
+    }
+
+
+def test_seq_scan_em_tabela_por_tras_da_view():
+    resumo = resumir_plano(_plano("empresas"), "SELECT 1", {TABELA_BASE, "empresas", "socios"})
+    assert resumo["seq_scan_na_base"] == ["empresas"]
+
+
+def test_seq_scan_fora_da_base_nao_avisa():
+    resumo = resumir_plano(_plano("temp_cnpjs_excluir"), "SELECT 1", {TABELA_BASE, "empresas"})
+    assert not resumo["seq_scan_na_base"]
+    assert [n["relação"] for n in resumo["seq_scans"]] == ["temp_cnpjs_excluir"]
+
+
+def test_base_materializada_pelo_nome():
+    assert resumir_plano(_plano(TABELA_BASE), "SELECT 1")["seq_scan_na_base"] == [TABELA_BASE]
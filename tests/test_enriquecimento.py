@@ -0,0 +1,53 @@
+# Cache local do enriquecimento: Parquet por versão da base, lido em bloco (sem pickle)
+
+import os
+
+import pandas as pd
+import pytest
+
+import enriquecimento
+
+A, B, C, D = "00000000000191", "00000000000272", "00000000000353", "00000000000434"
+
+
+@pytest.fixture(autouse=True)
+def cache_temporario(tmp_path, monkeypatch):
+    monkeypatch.setattr(enriquecimento, "CACHE_DIR", str(tmp_path / "enriquecimento"))
+
+
+def _df(*cnpjs):
+    return pd.DataFrame({"cnpj": list(cnpjs), "razao_social": [f"EMPRESA {c[-3:]}" for c in cnpjs]})
+
+
+def test_acertos_e_inexistentes():
+    enriquecimento.gravar_cache(_df(A, B), [A, B, C], "v1")
+    df, faltantes = enriquecimento.ler_cache([A, C, D], "v1")
+    assert df.to_dict("records") == [{"cnpj": A, "razao_social": "EMPRESA 191"}]
+    # C foi buscado e não existe na base: não volta ao banco
+    assert faltantes == [D]
+
+
+def test_outra_versao_nao_reaproveita_e_apaga_a_anterior():
+    enriquecimento.gravar_cache(_df(A), [A], "v1")
+    enriquecimento.gravar_cache(_df(B), [B], "v2")
+    assert enriquecimento.ler_cache([A], "v2")[1] == [A]
+    assert len(os.listdir(enriquecimento.CACHE_DIR)) == 1
+
+
+def test_ttl_vencido(monkeypatch):
+    enriquecimento.gravar_cache(_df(A), [A], "v1")
+    monkeypatch.setattr(enriquecimento, "CACHE_TTL_HORAS", -1)
+    df, faltantes = enriquecimento.ler_cache([A], "v1")
+    assert df.empty and faltantes == [A]
+
+
+def test_consolida_arquivos_e_mantem_gravacao_mais_recente(monkeypatch):
+    monkeypatch.setattr(enriquecimento, "CACHE_MAX_ARQUIVOS", 2)
+    enriquecimento.gravar_cache(_df(A), [A], "v1")
+    enriquecimento.gravar_cache(_df(B), [B], "v1")
+    enriquecimento.gravar_cache(_df(A).assign(razao_social="NOVA"), [A], "v1")
+    diretorio = enriquecimento._diretorio_versao("v1")
+    assert len(enriquecimento._arquivos_cache(diretorio)) == 1
+    df, faltantes = enriquecimento.ler_cache([A, B], "v1")
+    assert dict(zip(df["cnpj"], df["razao_social"])) == {A: "NOVA", B: "EMPRESA 272"}
+    assert faltantes == []
@@ -0,0 +1,170 @@
+# Os três montadores de consulta passaram a compilar por filtros.py; estes testes fixam, para cada
+# parâmetro que cada um já recebia, o mesmo operador e a mesma coluna dos montadores originais.
+
+import re
+from datetime import date
+
+import pytest
+
+from filtros import (
+    CAMPOS, COLUNAS_SEM_TRGM, PARAMETROS_CONSULTA, PARAMETROS_GERADOR, colunas_ilike, compilar, compilar_where, condicao,
+    espec_de_parametros_ia, especificar,
+)
+
+
+def _where(espec, alias=None):
+    clausulas, params = compilar_where(espec, alias)
+    return " AND ".join(clausulas), params
+
+
+# --- IA Generator --------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("chave, valor, predicado", [
+    ('uf', ['SP'], "uf_normalizado = ANY("),
+    ('municipio', ['São Paulo'], "municipio_normalizado = ANY("),
+    ('bairro', ['Centro'], "bairro_normalizado = ANY("),
+    ('porte_empresa', ['ME'], "porte_empresa = ANY("),
+    ('natureza_juridica', ['Sociedade'], "unaccent(upper(natureza_juridica)) = ANY("),
+    ('opcao_simples', ['S'], "opcao_simples = ANY("),
+    ('opcao_mei', ['N'], "opcao_mei = ANY("),
+    ('ddd1', ['11'], "ddd1 = ANY("),
+    ('qtde_socios', ['2'], "qtde_socios = ANY(CAST(:f0 AS numeric[]))"),
+    ('nome_fantasia', ['padaria'], "nome_fantasia_normalizado ILIKE :f0_0"),
+    ('nome_socio_razao_social', ['silva'], "unaccent(nomes_socios) ILIKE :f0_0"),
+    ('qualificacao_socio', ['socio'], "unaccent(qualificacoes) ILIKE :f0_0"),
+    ('faixa_etaria_socio', ['31 a 40'], "unaccent(faixas_etarias) ILIKE :f0_0"),
+    ('cod_cnae_principal', [('4711302', 'Comércio')], "cod_cnae_principal = ANY("),
+    ('cod_cnae_secundario', [('4711302', 'Comércio')], "cod_cnae_secundario = ANY("),
+])
+def test_ia_generator_mantem_operadores(chave, valor, predicado):
+    sql, _ = _where(espec_de_parametros_ia({chave: valor}, gerador="ia"))
+    assert predicado in sql
+
+
+def test_ia_generator_cnae_secundario_por_igualdade():
+    sql, params = _where(espec_de_parametros_ia({'cod_cnae_secundario': [('4711302', 'x')]}, gerador="ia"))
+    assert "ILIKE" not in sql
+    assert params == {'f0': ['4711302']}
+
+
+def test_ia_generator_faixas():
+    espec = espec_de_parametros_ia({
+        'capital_social': (1000, 5000),
+        'data_inicio_atividade': (date(2020, 1, 1), date(2021, 1, 1)),
+    }, gerador="ia")
+    sql, params = _where(espec)
+    assert "capital_social >= :f0_min AND capital_social <= :f0_max" in sql
+    assert "data_inicio_atividade >= :f1_min AND data_inicio_atividade <= :f1_max" in sql
+    assert params == {'f0_min': 1000, 'f0_max': 5000, 'f1_min': date(2020, 1, 1), 'f1_max': date(2021, 1, 1)}
+
+
+# --- Re-Gerador ----------------------------------------------------------------------------------
+
+@pytest.mark.parametrize("chave, valor, predicado", [
+    ('uf', ['SP'], "vea.uf_normalizado = ANY("),
+    ('municipio', ['Campinas'], "vea.municipio_normalizado = ANY("),
+    ('bairro', ['Centro'], "vea.bairro_normalizado = ANY("),
+    ('natureza_juridica', ['Sociedade'], "unaccent(upper(vea.natureza_juridica)) = ANY("),
+    ('qualificacoes', ['Sócio-Administrador'], "unaccent(upper(vea.qualificacoes)) = ANY("),
+    ('faixas_etarias', ['31 a 40 anos'], "unaccent(upper(vea.faixas_etarias)) = ANY("),
+    ('ddd1', ['11'], "vea.ddd1 = ANY("),
+    ('porte_empresa', ['ME'], "vea.porte_empresa = ANY("),
+    ('opcao_simples', ['S'], "vea.opcao_simples = ANY("),
+    ('opcao_mei', ['N'], "vea.opcao_mei = ANY("),
+    ('nome_fantasia', ['padaria'], "vea.nome_fantasia_normalizado ILIKE :f0_0"),
+    ('nomes_socios', ['silva'], "unaccent(vea.nomes_socios) ILIKE :f0_0"),
+    ('cod_cnae_principal', [('4711302', 'x')], "vea.cod_cnae_principal = ANY("),
+    ('cod_cnae_secundario', [('4711302', 'x')], "vea.cod_cnae_secundario ILIKE :f0_0"),
+])
+def test_regerador_mantem_operadores(chave, valor, predicado):
+    sql, _ = _where(espec_de_parametros_ia({chave: valor}, gerador="regerador"), alias="vea")
+    assert predicado in sql
+
+
+@pytest.mark.parametrize("chave", ['qualificacoes', 'faixas_etarias'])
+def test_regerador_listas_de_socios_por_igualdade(chave):
+    sql, params = _where(espec_de_parametros_ia({chave: ['Sócio']}, gerador="regerador"), alias="vea")
+    assert "ILIKE" not in sql
+    assert params == {'f0': ['SOCIO']}
+
+
+def test_regerador_cnae_secundario_contem_codigo():
+    _, params = _where(espec_de_parametros_ia({'cod_cnae_secundario': [('4711302', 'x')]}, gerador="regerador"))
+    assert params == {'f0_0': '%4711302%'}
+
+
+@pytest.mark.parametrize("chave, coluna", [
+    ('cod_cnae_principal', 'vea.cnae_principal'),
+    ('cod_cnae_secundario', 'vea.cnae_secundario'),
+])
+def test_regerador_cnae_nulo_e_vazio_olham_a_descricao(chave, coluna):
+    espec = espec_de_parametros_ia({chave: [('(Nulo)', ''), ('(Vazio)', '')]}, gerador="regerador")
+    sql, _ = _where(espec, alias="vea")
+    assert f"{coluna} IS NULL" in sql
+    assert f"{coluna} = ''" in sql
+    assert f"vea.{chave} IS NULL" not in sql
+
+
+def test_regerador_ignora_parametros_do_ia_generator():
+    espec = espec_de_parametros_ia({'qualificacao_socio': ['x'], 'qtde_socios': ['2']}, gerador="regerador")
+    assert espec.condicoes == ()
+
+
+# --- Consulta Avançada / Pesquisa de Mercado -----------------------------------------------------
+
+def test_pesquisa_cnae_codigo_sem_curingas():
+    espec = especificar([condicao('cod_cnae_principal', 'cnae_codigo', ['4711302', '5611201'])])
+    sql, params = _where(espec)
+    assert "(cod_cnae_principal = ANY(CAST(:f0 AS text[])) OR cod_cnae_secundario ILIKE ANY(CAST(:f0_sec AS text[])))" in sql
+    assert params == {'f0': ['4711302', '5611201'], 'f0_sec': ['4711302', '5611201']}
+
+
+@pytest.mark.parametrize("campo, predicado", [
+    ('municipio', "municipio_normalizado ILIKE :f0_0"),
+    ('razao_social', "razao_social_normalizado ILIKE :f0_0"),
+    ('nome_fantasia', "nome_fantasia_normalizado ILIKE :f0_0"),
+    ('cnae_principal', "cnae_principal_normalizado ILIKE :f0_0"),
+    ('bairro', "bairro_normalizado ILIKE :f0_0"),
+    ('ddd1', "ddd1 ILIKE :f0_0"),
+    ('logradouro', "logradouro ILIKE :f0_0"),
+])
+def test_pesquisa_texto_contem(campo, predicado):
+    sql, params = _where(especificar([condicao(campo, 'contem', ['abc'])]))
+    assert predicado in sql
+    assert params == {'f0_0': '%ABC%'}
+
+
+def test_pesquisa_item_lista_por_regex():
+    sql, params = _where(especificar([condicao('qualificacoes', 'item_lista', ['Sócio'])]))
+    assert "unaccent(qualificacoes) ~* :f0_0" in sql
+    assert params == {'f0_0': r"(^|\|\s*)SOCIO(\s*\||$)"}
+
+
+def test_valores_sempre_como_parametros():
+    espec = especificar([condicao('uf', 'igual', ["SP'; DROP TABLE x; --"])])
+    sql, params = compilar(espec)
+    assert "DROP" not in sql
+    assert params == {'f0': ["SP'; DROP TABLE X; --"]}
+
+
+# --- Índices trgm (indices.py) -------------------------------------------------------------------
+
+def test_colunas_ilike_cobrem_todo_ilike_sobre_coluna_pura():
+    # Todo ILIKE que algum montador emite sobre coluna pura precisa estar na lista de índices trgm,
+    # menos as colunas de valores curtos demais para gerar trigramas
+    encontradas = set()
+    for mapa in (PARAMETROS_CONSULTA, *PARAMETROS_GERADOR.values()):
+        for campo, operador in mapa.values():
+            if operador in ('entre', 'idade_entre'):
+                continue
+            sql, _ = _where(especificar([condicao(campo, operador, ['4711302'])]))
+            encontradas.update(re.findall(r"(?<!unaccent\()\b(\w+) ILIKE", sql))
+    assert encontradas - COLUNAS_SEM_TRGM == set(colunas_ilike())
+    assert 'ddd1' in encontradas
+
+
+def test_colunas_ilike_sem_campos_com_unaccent():
+    assert 'cod_cnae_secundario' in colunas_ilike()
+    assert 'natureza_juridica' not in colunas_ilike()
+    assert 'ddd1' not in colunas_ilike()
+    assert not any(CAMPOS[c][0] in colunas_ilike() for c in CAMPOS if CAMPOS[c][1] == 'texto')
@@ -0,0 +1,46 @@
+# avaliar_predicados sobre o SQL compilado por filtros.py: os termos chegam como parâmetros ligados
+
+from filtros import compilar, condicao, especificar
+from indices import avaliar_predicados
+
+INDEXADAS = {'razao_social_normalizado', 'cod_cnae_secundario'}
+
+
+def _avaliar(*condicoes):
+    sql, params = compilar(especificar(list(condicoes)))
+    return avaliar_predicados(sql, INDEXADAS, params)
+
+
+def test_termo_curto_nao_usa_indice():
+    [item] = _avaliar(condicao('razao_social', 'contem', ['pa']))
+    assert item["coluna"] == 'razao_social_normalizado'
+    assert not item["usa_indice"]
+    assert "menos de 3" in item["motivo"]
+
+
+def test_termo_longo_usa_indice():
+    [item] = _avaliar(condicao('razao_social', 'contem', ['padaria']))
+    assert item["usa_indice"] and item["motivo"] == "ok"
+
+
+def test_ilike_any_do_cnae_secundario():
+    [ok] = _avaliar(condicao('cod_cnae_principal', 'cnae_codigo', ['4711302']))
+    assert ok["coluna"] == 'cod_cnae_secundario'
+    assert "ILIKE ANY" in ok["predicado"]
+    assert ok["usa_indice"]
+    [curto] = _avaliar(condicao('cod_cnae_principal', 'cnae_codigo', ['4711302', '47']))
+    assert not curto["usa_indice"]
+
+
+def test_coluna_com_unaccent_e_coluna_sem_indice():
+    avaliacao = {item["coluna"]: item for item in _avaliar(
+        condicao('nomes_socios', 'contem', ['silva']),
+        condicao('municipio', 'contem', ['campinas']),
+    )}
+    assert "função" in avaliacao['nomes_socios']["motivo"]
+    assert avaliacao['municipio_normalizado']["motivo"] == "coluna sem índice trgm"
+
+
+def test_sql_literal_continua_avaliado():
+    [item] = avaliar_predicados("SELECT 1 FROM t WHERE razao_social_normalizado ILIKE '%PA%'", INDEXADAS)
+    assert not item["usa_indice"]
@@ -0,0 +1,78 @@
+# Tipos compactos para os DataFrames guardados na sessão
+
+# tipagem.py
+#
+# Leitores do banco e uploads (dtype=str) entregam tudo como object. Aqui, uma vez na carga:
+# colunas de poucos valores viram category, texto livre vira string Arrow, capital_social vira número,
+# datas viram datetime64 e inteiros são reduzidos ao menor tipo que os comporta.
+# Conversões que descartariam valores (ex.: data fora do formato ISO num upload) não são aplicadas.
+
+import numpy as np
+import pandas as pd
+
+COLUNAS_CATEGORICAS = (
+    'uf', 'porte_empresa', 'situacao_cadastral', 'opcao_simples', 'opcao_mei', 'natureza_juridica', 'ddd1',
+    'ddd2', 'identificador_matriz_filial',
+)
+COLUNAS_NUMERICAS = ('capital_social',)
+COLUNAS_DATA = ('data_inicio_atividade', 'data_situacao_cadastral')
+
+
+def _dtype_texto():
+    # String Arrow com NaN como nulo (mesma semântica de object para isna/comparações); None se indisponível
+    for criar in (lambda: pd.StringDtype("pyarrow", na_value=np.nan), lambda: pd.StringDtype("pyarrow_numpy")):
+        try:
+            return criar()
+        except (TypeError, ValueError, ImportError):
+            continue
+    return None
+
+
+DTYPE_TEXTO = _dtype_texto()
+
+
+def _sem_perda(original, convertida):
+    """`convertida` se ela não transformou nenhum valor preenchido em nulo; senão `original`."""
+    return convertida if convertida.isna().sum() == original.isna().sum() else original
+
+
+def _compactar_coluna(nome, serie):
+    if nome in COLUNAS_CATEGORICAS:
+        return serie if isinstance(serie.dtype, pd.CategoricalDtype) else serie.astype("category")
+    if nome in COLUNAS_NUMERICAS and not pd.api.types.is_numeric_dtype(serie):
+        return _sem_perda(serie, pd.to_numeric(serie, errors="coerce"))
+    if nome in COLUNAS_DATA and not pd.api.types.is_datetime64_any_dtype(serie):
+        if pd.api.types.is_object_dtype(serie) or pd.api.types.is_string_dtype(serie):
+            texto = serie.astype(str).where(serie.notna())
+            return _sem_perda(serie, pd.to_datetime(texto, errors="coerce", format="ISO8601"))
+        return serie
+    if pd.api.types.is_integer_dtype(serie) and not isinstance(serie.dtype, pd.CategoricalDtype):
+        return pd.to_numeric(serie, downcast="integer")
+    if DTYPE_TEXTO is not None and serie.dtype == object:
+        # Só colunas que são inteiramente texto (ou nulo); listas, Decimals etc. ficam como estão
+        if pd.api.types.infer_dtype(serie, skipna=True) in ("string", "empty"):
+            return serie.astype(DTYPE_TEXTO)
+    return serie
+
+
+def memoria_mb(df):
+    """Memória ocupada por `df`, em MB, contando o conteúdo das strings."""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+
+def compactar(df):
+    """
+    Cópia de `df` com os tipos compactos descritos no topo do módulo.
+    Retorna (df_compacto, mb_antes, mb_depois).
+    """
+    if df is None or df.empty:
+        return df, 0.0, 0.0
+    antes = memoria_mb(df)
+    compacto = pd.DataFrame({nome: _compactar_coluna(nome, df[nome]) for nome in df.columns}, index=df.index)
+    return compacto, antes, memoria_mb(compacto)
+
+
+def resumo_memoria(antes, depois):
+    """Texto curto com a memória antes e depois da compactação."""
+    reducao = (1 - depois / antes) * 100 if antes else 0
+    return f"💾 Memória: {antes:,.1f} MB → {depois:,.1f} MB ({reducao:.0f}% a menos)"
@@ -3,7 +3,8 @@
 # utils.py
 
 import pandas as pd
-from unidecode import unidecode
+
+from localidades import normalizar
 
 # --- CONSTANTES DE PREÇO CENTRALIZADAS ---
 PRECO_POR_CNPJ_ENRIQUECIDO = 0.05 
@@ -14,7 +15,7 @@ CUSTO_ADICIONAL_POR_MUNICIPIO = 0.07
 def normalizar_bairro(bairro):
     """Normaliza o nome do bairro para comparação, removendo acentos e convertendo para maiúsculas."""
     if isinstance(bairro, str):
-        return unidecode(bairro.upper().split('/')[0].strip())
+        return normalizar(bairro, "bairro")
     return bairro # Retorna como está se não for string (e.g., NaN)
 
 def calcular_custo_oportunidades(df_oportunidades_calc):